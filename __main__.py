@@ -1,3 +1,31 @@
 """Managing my infrastructure with Pulumi"""
 
-from luffy import cloudfront, dns, kms, vm
+import time
+import importlib
+import pulumi
+
+from luffy import instrument
+
+instrument.enable()
+
+# Modules are only loaded and registered when selected
+config = pulumi.Config()
+everything = ["vm", "kms", "cloudfront", "dns"]
+modules = config.get_object("modules") or everything
+# Resources of a module left out would be deleted: other modules should
+# be deployed in other stacks
+stacks = config.get_object("stacks") or {}
+missing = [
+    module
+    for module in everything
+    if module not in modules
+    and stacks.get(module, pulumi.get_stack()) == pulumi.get_stack()
+]
+if missing:
+    raise RuntimeError(
+        f"{', '.join(missing)}: not selected and not deployed in another stack"
+    )
+for module in modules:
+    start = time.perf_counter()
+    importlib.import_module(f"luffy.{module}").register()
+    pulumi.log.debug(f"{module}: registered in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,196 @@
+"""Benchmark construction of the program graph with mocks.
+
+Each scenario is built in its own process with a synthetic fleet:
+once to measure wall time, once more to measure peak memory, as
+tracing allocations slows down the build. Resources registered for
+each type and by each helper are deterministic: the exit status is
+non-zero if any of them grew compared to the baseline. Wall time
+depends on the machine: it only fails when it exceeds the baseline by
+a large ratio (`--max-slowdown`). Memory is only reported.
+
+    python -m benchmarks.construction            # run and check
+    python -m benchmarks.construction --save     # record a new baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import collections
+import subprocess
+import tracemalloc
+
+# servers, zones
+scenarios = {
+    "small": (4, 6),
+    "medium": (16, 60),
+    "large": (50, 200),
+}
+baseline = os.path.join(os.path.dirname(__file__), "baseline.json")
+geolocations = [["EU", "AF"], ["NA", "SA"], ["AS", "OC"]]
+
+
+def fleet(count):
+    """Synthetic fleet of web servers, two per geolocation."""
+    from luffy import vm
+
+    servers = []
+    for i in range(count):
+        name = f"web{i:02}.bench.example"
+        if i % 2:
+            server = vm.VultrServer(name, plan="vc2-1c-1gb", region="ord")
+        else:
+            server = vm.HetznerServer(name, str(1000 + i))
+        servers.append(
+            {
+                "server": server,
+                "geolocations": [
+                    ("continent", geolocations[i // 2 % len(geolocations)])
+                ],
+                "region": "eu-central-1",
+                "tags": ["web"],
+                "capacity": 2 - i % 2,
+            }
+        )
+    return servers
+
+
+def zones(count):
+    """Synthetic zones, split between Gandi, Route53 and both."""
+    import pulumiverse_gandi as gandi
+    from luffy import dns
+
+    provider = gandi.Provider("gandi-bench")
+    kinds = itertools.cycle(
+        [
+            lambda name: dns.GandiZone(name, provider).sign(),
+            lambda name: dns.Route53Zone(name).sign(),
+            lambda name: dns.MultiZone(
+                dns.Route53Zone(name).sign(), dns.GandiZone(name, provider)
+            ),
+        ]
+    )
+    for i, kind in zip(range(count), kinds):
+        zone = kind(f"zone{i:03}.example")
+        zone.www("@").www("www").www("media")
+        zone.fastmail_mx()
+    dns.materialize()
+
+
+def measure(name, memory=False):
+    """Build a scenario and measure it.
+
+    With `memory`, allocations are traced and the peak is returned
+    instead of the wall time.
+    """
+    from luffy import mocks, vm
+
+    servers, count = scenarios[name]
+
+    def build():
+        vm.inventory = vm.Inventory(fleet(servers))
+        zones(count)
+
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = mocks.run(build)
+    elapsed = time.perf_counter() - start
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        return {"memory": peak}
+    return {
+        "wall": elapsed,
+        "resources": len(result.resources),
+        "types": dict(collections.Counter(r.typ for r in result.resources)),
+        "helpers": dict(result.helpers),
+    }
+
+
+def compare(result, reference, slowdown=0):
+    """Counts that grew compared to the baseline, and large slowdowns."""
+    grown = []
+    if slowdown and "wall" in reference:
+        if result["wall"] > reference["wall"] * slowdown:
+            grown.append(f"wall: {reference['wall']:.3f}s -> {result['wall']:.3f}s")
+    if result["resources"] > reference["resources"]:
+        grown.append(f"resources: {reference['resources']} -> {result['resources']}")
+    for key in ("types", "helpers"):
+        for name, count in sorted(result[key].items()):
+            before = reference[key].get(name, 0)
+            if count > before:
+                grown.append(f"{name}: {before} -> {count}")
+    return grown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", default=list(scenarios))
+    parser.add_argument("--save", action="store_true", help="save as baseline")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=3,
+        help="fail when wall time exceeds the baseline by this ratio (0 to disable)",
+    )
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.run:
+        os.environ["LUFFY_CACHE"] = "off"
+        json.dump(measure(options.run, options.memory), sys.stdout)
+        return 0
+
+    try:
+        with open(baseline) as f:
+            reference = json.load(f)
+    except FileNotFoundError:
+        reference = {}
+    results = {}
+    failed = False
+    for name in options.scenarios:
+        result = {}
+        for args in ([], ["--memory"]):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.construction", "--run", name] + args,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result.update(json.loads(output))
+        results[name] = result
+        line = (
+            f"{name:10} {result['wall']:8.3f}s "
+            f"{result['memory'] / 1024 / 1024:8.1f}MiB "
+            f"{result['resources']:6} resources"
+        )
+        print(line)
+        if name not in reference:
+            print("  no baseline")
+            failed = True
+            continue
+        for change in compare(result, reference[name], options.max_slowdown):
+            print(f"  {change}")
+            failed = True
+
+    if options.max_slowdown:
+        print(f"wall time gated at {options.max_slowdown:g}x the baseline")
+    else:
+        print("wall time not gated")
+    if options.save:
+        for result in results.values():
+            # Only reported
+            del result["memory"]
+            result["wall"] = round(result["wall"], 3)
+        with open(baseline, "w") as f:
+            json.dump({**reference, **results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+    return failed and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -86,16 +86,35 @@
             ps.pip
             ps.setuptools
             ps.black
+            ps.pytest
+            ps.boto3
+            ps.moto
             pulumiProviders.vultr.python
             pulumiProviders.gandi.python
           ]));
       in
       {
         packages.poetry = pkgs.poetry;
+        checks.functions = pkgs.runCommand "functions" { nativeBuildInputs = [ pkgs.nodejs ]; } ''
+          cd ${./.}/luffy/functions
+          node replay.js accept.js < accept.txt
+          touch $out
+        '';
+        checks.tests = pkgs.runCommand "tests" { nativeBuildInputs = [ pythonEnv pkgs.nodejs ]; } ''
+          cd ${./.}
+          HOME=$TMPDIR python -m pytest -q -p no:cacheprovider
+          touch $out
+        '';
+        checks.benchmarks = pkgs.runCommand "benchmarks" { nativeBuildInputs = [ pythonEnv ]; } ''
+          cd ${./.}
+          HOME=$TMPDIR python -m benchmarks.construction small medium
+          touch $out
+        '';
         devShell = pythonEnv.env.overrideAttrs (oldAttrs: {
           name = "pulumi-take1";
           buildInputs = [
             pkgs.pulumi-bin
+            pkgs.nodejs
             pulumiProviders.vultr.plugin
             pulumiProviders.gandi.plugin
           ];
@@ -0,0 +1,165 @@
+"""Batched DNS-01 challenges for acme.luffy.cx.
+
+`_acme-challenge` records of our domains are CNAME to
+`{domain}.acme.luffy.cx`. All the pending challenges are written with
+a single change batch and a single wait for propagation. They are
+removed the same way, leaving other values of the same records alone.
+Challenges are given on stdin as `domain value` lines:
+
+    python -m luffy.acme present < challenges
+    python -m luffy.acme cleanup < challenges
+
+With certbot, use `certbot-auth` and `certbot-cleanup` as manual hooks.
+Challenges are spooled until the last one, then sent together.
+
+Credentials are the ones of the ACME user. The zone ID is exported by
+the stack as `acme-zone`.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import tempfile
+
+import boto3
+
+from . import route53
+
+zone = "acme.luffy.cx"
+
+
+def record(domain):
+    """Name of the TXT record for a domain."""
+    domain = domain.rstrip(".").removeprefix("*.").removeprefix("_acme-challenge.")
+    return f"{domain}.{zone}."
+
+
+def group(challenges):
+    """Group challenge values by record name."""
+    records = {}
+    for domain, value in challenges:
+        records.setdefault(record(domain), set()).add(value)
+    return {name: sorted(values) for name, values in sorted(records.items())}
+
+
+def current(client, zone_id, names):
+    """Current values of the TXT records with the given names."""
+    return {
+        rrset["Name"]: [r["Value"].strip('"') for r in rrset["ResourceRecords"]]
+        for rrset in route53.rrsets(client, zone_id)
+        if rrset["Type"] == "TXT" and rrset["Name"] in names
+    }
+
+
+def txt(name, values, ttl):
+    return {
+        "Name": name,
+        "Type": "TXT",
+        "TTL": ttl,
+        "ResourceRecords": [{"Value": f'"{v}"'} for v in values],
+    }
+
+
+def present(client, zone_id, challenges, ttl=60):
+    """Publish all challenges in one batch.
+
+    Values already present for the same names (another certificate
+    being issued) are kept.
+    """
+    records = group(challenges)
+    if not records:
+        return None
+    existing = current(client, zone_id, records)
+    return route53.change(
+        client,
+        zone_id,
+        [
+            {
+                "Action": "UPSERT",
+                "ResourceRecordSet": txt(
+                    name, sorted(set(existing.get(name, [])) | set(values)), ttl
+                ),
+            }
+            for name, values in records.items()
+        ],
+        f"ACME challenges for {len(records)} names",
+    )
+
+
+def cleanup(client, zone_id, challenges, ttl=60):
+    """Remove all challenges in one batch.
+
+    Only the given values are removed, the RRset is deleted when no
+    value is left.
+    """
+    records = group(challenges)
+    # Deletions need the current content of each RRset
+    rrsets = {
+        rrset["Name"]: rrset
+        for rrset in route53.rrsets(client, zone_id)
+        if rrset["Type"] == "TXT" and rrset["Name"] in records
+    }
+    changes = []
+    for name, rrset in sorted(rrsets.items()):
+        values = [r["Value"].strip('"') for r in rrset["ResourceRecords"]]
+        left = [v for v in values if v not in records[name]]
+        if left == values:
+            continue
+        if left:
+            changes.append(
+                {"Action": "UPSERT", "ResourceRecordSet": txt(name, left, ttl)}
+            )
+        else:
+            changes.append({"Action": "DELETE", "ResourceRecordSet": rrset})
+    if not changes:
+        return None
+    return route53.change(
+        client, zone_id, changes, f"ACME cleanup for {len(changes)} names"
+    )
+
+
+def spool(action):
+    """Spool a certbot challenge. Return all challenges once complete."""
+    key = hashlib.sha256(os.environ["CERTBOT_ALL_DOMAINS"].encode()).hexdigest()
+    path = os.path.join(tempfile.gettempdir(), f"luffy-acme-{key[:16]}.{action}")
+    with open(path, "a") as f:
+        f.write(f"{os.environ['CERTBOT_DOMAIN']} {os.environ['CERTBOT_VALIDATION']}\n")
+    if os.environ.get("CERTBOT_REMAINING_CHALLENGES", "0") != "0":
+        return []
+    with open(path) as f:
+        challenges = [line.split() for line in f if line.strip()]
+    os.unlink(path)
+    return challenges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batched ACME DNS-01 challenges")
+    parser.add_argument(
+        "action", choices=["present", "cleanup", "certbot-auth", "certbot-cleanup"]
+    )
+    parser.add_argument("--zone-id", help="ID of the acme.luffy.cx zone")
+    parser.add_argument("--ttl", type=int, default=60, help="TTL of records")
+    parser.add_argument("--endpoint-url", help="Route53 endpoint")
+    options = parser.parse_args()
+
+    if options.action.startswith("certbot-"):
+        challenges = spool(options.action)
+        if not challenges:
+            return 0
+    else:
+        challenges = [line.split() for line in sys.stdin if line.strip()]
+
+    client = boto3.client("route53", endpoint_url=options.endpoint_url)
+    zone_id = options.zone_id or route53.zone_id(client, zone)
+    if options.action in ("present", "certbot-auth"):
+        change = present(client, zone_id, challenges, ttl=options.ttl)
+    else:
+        change = cleanup(client, zone_id, challenges, ttl=options.ttl)
+    if change:
+        print(f"{len(challenges)} challenges, {change} in sync", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
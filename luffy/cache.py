@@ -0,0 +1,73 @@
+"""Persistent cache for lookups.
+
+Values are stored next to the local state and expire after
+`cache-ttl` seconds (one day by default). They are also invalidated
+when the credentials used to fetch them change. Set
+`LUFFY_CACHE=refresh` to force a refresh or `LUFFY_CACHE=off` to
+disable the cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+import pulumi
+
+path = os.path.join(".pulumi", "luffy-cache.json")
+entries = None
+
+
+def load():
+    global entries
+    if entries is None:
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+    return entries
+
+
+def save():
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def fingerprint(config, environ):
+    """Fingerprint of the credentials in use."""
+    project = pulumi.get_project()
+    values = [
+        pulumi.runtime.get_config(k if ":" in k else f"{project}:{k}") for k in config
+    ] + [os.environ.get(k) for k in environ]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def cached(key, fetch, config=(), environ=()):
+    """Return the cached value for key or call fetch() to get it.
+
+    The result of fetch() can be an output. The value is always
+    returned as an output. Credentials are given as configuration keys
+    and environment variables.
+    """
+    mode = os.environ.get("LUFFY_CACHE")
+    if mode == "off":
+        return pulumi.Output.from_input(fetch())
+    ttl = pulumi.Config().get_int("cache-ttl") or 86400
+    credentials = fingerprint(config, environ)
+    entry = load().get(key)
+    if (
+        mode != "refresh"
+        and entry is not None
+        and entry["credentials"] == credentials
+        and time.time() - entry["time"] < ttl
+    ):
+        return pulumi.Output.from_input(entry["value"])
+
+    def store(value):
+        entries[key] = dict(time=time.time(), credentials=credentials, value=value)
+        save()
+        return value
+
+    return pulumi.Output.from_input(fetch()).apply(store)
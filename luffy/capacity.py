@@ -0,0 +1,283 @@
+"""Capacity advisor for web servers, from HAProxy stats.
+
+HAProxy CSV stats are recorded periodically from each web server, one
+directory per server. For each group of servers covering the same
+geolocations, this reports the request rate, the queue depth and
+percentiles of the response time, then proposes changes to
+`servers.yaml`: upsizing a saturated Vultr server or adding a replica
+when the whole group is saturated, once upsized:
+
+    python -m luffy.capacity snapshot stats/     # from cron
+    python -m luffy.capacity stats/
+
+HAProxy only reports the average response time over the last 1024
+requests (`rtime`). Percentiles are therefore computed over these
+averages, one per snapshot, not over individual requests.
+"""
+
+import os
+import sys
+import csv
+import math
+import time
+import argparse
+import textwrap
+import collections
+import urllib.request
+
+import yaml
+
+from . import cflogs
+from .vm import Inventory, pools
+
+path = os.path.join(os.path.dirname(__file__), "servers.yaml")
+# Vultr plans, from the smallest, with their relative capacity
+plans = {
+    "vc2-1c-1gb": 1,
+    "vc2-1c-2gb": 1,
+    "vc2-2c-4gb": 2,
+    "vc2-4c-8gb": 4,
+    "vc2-6c-16gb": 6,
+}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of values."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def rows(path):
+    """Parse a CSV stats snapshot."""
+    with open(path, newline="") as f:
+        header = f.readline().removeprefix("# ").rstrip("\n").split(",")
+        for row in csv.DictReader(f, fieldnames=header):
+            if row["pxname"] and not row["pxname"].startswith("#"):
+                yield row
+
+
+def number(row, key):
+    try:
+        return float(row.get(key) or 0)
+    except ValueError:
+        return 0
+
+
+class Stats:
+    """Statistics for a set of servers."""
+
+    def __init__(self):
+        self.rates = []
+        self.queues = []
+        self.rtime = cflogs.Histogram()
+
+    def add(self, path):
+        """Add a snapshot."""
+        rate = queue = 0
+        for row in rows(path):
+            if row["svname"] == "FRONTEND":
+                rate += number(row, "req_rate") or number(row, "rate")
+            elif row["svname"] == "BACKEND":
+                queue += number(row, "qcur")
+                if number(row, "rtime"):
+                    self.rtime.add(number(row, "rtime") / 1000)
+        self.rates.append(rate)
+        self.queues.append(queue)
+
+    def merge(self, other):
+        self.rates.extend(other.rates)
+        self.queues.extend(other.queues)
+        self.rtime.buckets.update(other.rtime.buckets)
+        self.rtime.total += other.rtime.total
+
+
+def servers():
+    """Enabled web servers from the inventory, without declaring them."""
+    with open(path) as f:
+        entries = yaml.safe_load(f)
+    for entry in entries:
+        Inventory.validate(entry)
+    return [
+        entry
+        for entry in entries
+        if "web" in entry.get("tags", []) and not entry.get("disabled")
+    ]
+
+
+def group(entry):
+    """Geolocations covered by a server."""
+    return " ".join(
+        f"{kind}:{','.join(codes)}" for kind, codes in entry["geolocations"].items()
+    )
+
+
+def advise(entries, stats, options):
+    """Propose changes for each group of servers."""
+    groups = collections.defaultdict(list)
+    for entry in entries:
+        groups[group(entry)].append(entry)
+    proposals = {}
+    for name, members in sorted(groups.items()):
+        if not any(entry["name"] in stats for entry in members):
+            continue
+        changes = []
+        capacity = sum(entry.get("capacity", 1) for entry in members)
+        # Sum of the peak rate of each server
+        rate = sum(
+            percentile(stats[entry["name"]].rates, 95) or 0
+            for entry in members
+            if entry["name"] in stats
+        )
+        for entry in members:
+            current = stats.get(entry["name"])
+            if current is None or not current.rtime.total:
+                continue
+            rtime = current.rtime.percentile(95)
+            queue = percentile(current.queues, 95)
+            if rtime <= options.max_rtime and queue <= options.max_queue:
+                continue
+            plan = entry.get("vultr", {}).get("plan")
+            larger = [p for p in plans if plans[p] > plans.get(plan, math.inf)]
+            load = f"p95 rtime {rtime:.0f}ms, p95 queue {queue:.0f}"
+            if larger:
+                changes.append(
+                    f"upsize {entry['name']}: plan {plan} -> {larger[0]} ({load})"
+                )
+                # The same load should then be absorbed by the new plan
+                capacity += entry.get("capacity", 1) * (
+                    plans[larger[0]] / plans[plan] - 1
+                )
+            else:
+                changes.append(f"{entry['name']} is saturated ({load})")
+        needed = math.ceil(rate / options.max_rate)
+        if needed > capacity:
+            missing = math.ceil((needed - capacity) / options.replica_capacity)
+            changes.append(
+                f"add {missing} replica(s) for {name}"
+                f" ({rate:.0f} req/s, capacity {capacity:g}, needed {needed})"
+            )
+            changes.extend(replica(entries, members, i) for i in range(missing))
+        elif (
+            not changes
+            and capacity - min(e.get("capacity", 1) for e in members) >= needed * 2
+        ):
+            # Half of the capacity would still be enough without one server
+            replicas = pools["web"]
+            minimum = max(
+                replicas.get(f"{kind}:{code}", replicas.get("*", 1))
+                for kind, codes in members[0]["geolocations"].items()
+                for code in codes
+            )
+            if len(members) > minimum:
+                changes.append(
+                    f"{name} is oversized ({rate:.0f} req/s, capacity {capacity})"
+                )
+        proposals[name] = changes
+    return proposals
+
+
+def replica(entries, members, index):
+    """A new server entry for servers.yaml, as YAML."""
+    numbers = [
+        int(entry["name"][3:5])
+        for entry in entries
+        if entry["name"][:3] == "web" and entry["name"][3:5].isdigit()
+    ]
+    model = ([m for m in members if "vultr" in m] or members)[0]
+    vultr = model.get("vultr", {"plan": "vc2-1c-1gb", "region": "ord"})
+    entry = {
+        "name": f"web{max(numbers, default=0) + 1 + index:02}.luffy.cx",
+        "vultr": {"plan": vultr["plan"], "region": vultr["region"]},
+        "geolocations": model["geolocations"],
+        "region": model["region"],
+        "tags": ["web"],
+    }
+    return yaml.safe_dump([entry], sort_keys=False, default_flow_style=None).rstrip()
+
+
+def snapshot(directory, url):
+    """Record a CSV stats snapshot for each web server."""
+    for entry in servers():
+        target = os.path.join(directory, entry["name"])
+        os.makedirs(target, exist_ok=True)
+        try:
+            with urllib.request.urlopen(url.format(name=entry["name"])) as response:
+                content = response.read()
+        except OSError as e:
+            print(f"{entry['name']}: {e}", file=sys.stderr)
+            continue
+        with open(os.path.join(target, f"{int(time.time())}.csv"), "wb") as f:
+            f.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="capacity advisor for web servers")
+    parser.add_argument("action", nargs="?", choices=["snapshot"])
+    parser.add_argument("directory", help="directory of stats snapshots")
+    parser.add_argument(
+        "--url",
+        default="https://{name}/haproxy;csv",
+        help="URL of CSV stats for a server",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=100,
+        help="requests per second for a unit of capacity",
+    )
+    parser.add_argument(
+        "--max-rtime",
+        type=float,
+        default=500,
+        help="p95 of average response times (HAProxy rtime), in ms",
+    )
+    parser.add_argument("--max-queue", type=float, default=10, help="p95 queue depth")
+    parser.add_argument(
+        "--replica-capacity", type=int, default=1, help="capacity of a new server"
+    )
+    options = parser.parse_args()
+
+    if options.action == "snapshot":
+        snapshot(options.directory, options.url)
+        return 0
+
+    entries = servers()
+    stats = {}
+    for path in cflogs.files([options.directory]):
+        if not path.endswith(".csv"):
+            continue
+        name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        stats.setdefault(name, Stats()).add(path)
+
+    for entry in entries:
+        if entry["name"] not in stats:
+            print(f"{entry['name']}: no stats", file=sys.stderr)
+    proposals = advise(entries, stats, options)
+    for name, changes in proposals.items():
+        total = Stats()
+        members = [e for e in entries if group(e) == name and e["name"] in stats]
+        for entry in members:
+            total.merge(stats[entry["name"]])
+        print(f"{name}:")
+        for entry in members:
+            current = stats[entry["name"]]
+            print(
+                f"  {entry['name']}: {percentile(current.rates, 50):.0f} req/s"
+                f" (p95 {percentile(current.rates, 95):.0f}),"
+                f" queue p95 {percentile(current.queues, 95):.0f}"
+            )
+        if total.rtime.total:
+            percentiles = ", ".join(
+                f"p{p}={total.rtime.percentile(p):.0f}ms" for p in (50, 90, 99)
+            )
+            print(f"  average response time: {percentiles}")
+        for change in changes:
+            # New entries for servers.yaml are indented further
+            print(textwrap.indent(change, "\n" in change and "    " or "  "))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Analyze CloudFront standard logs.
+
+Logs are read line by line with bounded memory. For each distribution
+(the directory containing the log files, which is the logging prefix),
+this reports the hit ratio, the most missed paths and percentiles of
+the time to first byte:
+
+    aws s3 sync s3://<bucket>/ logs/
+    python -m luffy.cflogs logs/
+"""
+
+import os
+import sys
+import gzip
+import math
+import argparse
+import collections
+
+
+class TopK:
+    """Approximate most frequent items with bounded memory (Space-Saving)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item):
+        if item in self.counts:
+            self.counts[item] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = 1
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(victim) + 1
+
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+
+class Histogram:
+    """Log-scale histogram of durations, with 5% precision."""
+
+    base = 1.05
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.total = 0
+
+    def add(self, seconds):
+        milliseconds = max(seconds * 1000, 0.1)
+        self.buckets[math.floor(math.log(milliseconds, self.base))] += 1
+        self.total += 1
+
+    def percentile(self, p):
+        """Upper bound of the p-th percentile, in milliseconds."""
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= p / 100 * self.total:
+                return self.base ** (bucket + 1)
+        return None
+
+
+class Stats:
+    """Statistics for a distribution."""
+
+    def __init__(self, top):
+        self.edge = collections.Counter()
+        self.results = collections.Counter()
+        self.missed = TopK(top * 10)
+        self.ttfb = Histogram()
+        self.ttfb_miss = Histogram()
+
+    def add(self, entry):
+        # Detailed result tells apart misses served by Origin Shield
+        self.edge[entry["x-edge-result-type"]] += 1
+        self.results[
+            entry["x-edge-detailed-result-type"] or entry["x-edge-result-type"]
+        ] += 1
+        try:
+            ttfb = float(entry["time-to-first-byte"])
+        except (TypeError, ValueError):
+            ttfb = None
+        if ttfb is not None:
+            self.ttfb.add(ttfb)
+        if entry["x-edge-result-type"] == "Miss":
+            self.missed.add(entry["cs-uri-stem"])
+            if ttfb is not None:
+                self.ttfb_miss.add(ttfb)
+
+    def hit_ratio(self):
+        """Ratio of cacheable requests served from the edge."""
+        hits = self.edge["Hit"] + self.edge["RefreshHit"]
+        total = hits + self.edge["Miss"]
+        return total and hits / total or None
+
+
+def entries(path):
+    """Parse a log file, line by line."""
+    opener = path.endswith(".gz") and gzip.open or open
+    fields = []
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("#Fields:"):
+                fields = line.split()[1:]
+                continue
+            if line.startswith("#") or not line:
+                continue
+            values = line.split("\t")
+            entry = collections.defaultdict(
+                lambda: None,
+                ((k, v != "-" and v or None) for k, v in zip(fields, values)),
+            )
+            yield entry
+
+
+def files(paths):
+    """Log files from a list of files and directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="analyze CloudFront logs")
+    parser.add_argument("paths", nargs="+", help="log files or directories")
+    parser.add_argument("--top", type=int, default=10, help="missed paths to show")
+    options = parser.parse_args()
+
+    stats = {}
+    for path in files(options.paths):
+        distribution = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        current = stats.setdefault(distribution, Stats(options.top))
+        for entry in entries(path):
+            current.add(entry)
+
+    for distribution, current in sorted(stats.items()):
+        print(f"{distribution}:")
+        print(f"  requests: {sum(current.results.values())}")
+        for result, count in current.results.most_common():
+            print(f"    {result}: {count}")
+        if current.hit_ratio() is not None:
+            print(f"  hit ratio: {current.hit_ratio():.1%}")
+        for name, histogram in (("all", current.ttfb), ("miss", current.ttfb_miss)):
+            if histogram.total:
+                percentiles = ", ".join(
+                    f"p{p}={histogram.percentile(p):.0f}ms" for p in (50, 90, 99)
+                )
+                print(f"  time to first byte ({name}): {percentiles}")
+        if current.missed.counts:
+            print("  most missed paths:")
+            for uri, count in current.missed.most_common(options.top):
+                print(f"    {count:6} {uri}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,286 @@
+import os
+import collections
+import types
 import pulumi
 import pulumi_aws as aws
+import pulumiverse_gandi as gandi
 
+from . import vm, stacks
 
-def cloudfront_distribution(domain):
-    """Cookie-less Cloudfront distribution."""
-    return aws.cloudfront.Distribution(
+policies = None
+functions = None
+logs = None
+us_east_1 = None
+distributions = None
+providers = {}
+
+
+def get_policies():
+    """Cache and origin request policies shared by all distributions."""
+    global policies
+    if policies is not None:
+        return policies
+    cache_policy = aws.cloudfront.CachePolicy(
+        "cookieless",
+        comment="Cookie-less, keyed on normalized Accept",
+        min_ttl=0,
+        default_ttl=86400,
+        max_ttl=31536000,
+        parameters_in_cache_key_and_forwarded_to_origin=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginArgs(
+            # Normalize Accept-Encoding in the cache key
+            enable_accept_encoding_brotli=True,
+            enable_accept_encoding_gzip=True,
+            # No cookies
+            cookies_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginCookiesConfigArgs(
+                cookie_behavior="none",
+            ),
+            # Key on the "Accept" header (normalized by a function)
+            headers_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginHeadersConfigArgs(
+                header_behavior="whitelist",
+                headers=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginHeadersConfigHeadersArgs(
+                    items=["Accept"],
+                ),
+            ),
+            # No need for the query string
+            query_strings_config=aws.cloudfront.CachePolicyParametersInCacheKeyAndForwardedToOriginQueryStringsConfigArgs(
+                query_string_behavior="none",
+            ),
+        ),
+    )
+    # Everything needed by the origin is already in the cache key,
+    # except the Host header as origins are the web servers themselves
+    origin_request_policy = aws.cloudfront.OriginRequestPolicy(
+        "cookieless",
+        comment="Cookie-less, with Host",
+        cookies_config=aws.cloudfront.OriginRequestPolicyCookiesConfigArgs(
+            cookie_behavior="none",
+        ),
+        headers_config=aws.cloudfront.OriginRequestPolicyHeadersConfigArgs(
+            header_behavior="whitelist",
+            headers=aws.cloudfront.OriginRequestPolicyHeadersConfigHeadersArgs(
+                items=["Host"],
+            ),
+        ),
+        query_strings_config=aws.cloudfront.OriginRequestPolicyQueryStringsConfigArgs(
+            query_string_behavior="none",
+        ),
+    )
+    policies = (cache_policy, origin_request_policy)
+    return policies
+
+
+def get_functions():
+    """Viewer-request functions shared by all distributions.
+
+    The Accept header is reduced to the image format to serve before
+    being used in the cache key. See `luffy/functions/`.
+    """
+    global functions
+    if functions is not None:
+        return functions
+    path = os.path.join(os.path.dirname(__file__), "functions", "accept.js")
+    with open(path) as f:
+        code = f.read()
+    accept = aws.cloudfront.Function(
+        "normalize-accept",
+        runtime="cloudfront-js-1.0",
+        comment="Reduce Accept to image formats",
+        code=code,
+        publish=True,
+    )
+    functions = [
+        aws.cloudfront.DistributionDefaultCacheBehaviorFunctionAssociationArgs(
+            event_type="viewer-request",
+            function_arn=accept.arn,
+        )
+    ]
+    return functions
+
+
+def get_logs():
+    """S3 bucket receiving standard logs of all distributions."""
+    global logs
+    if logs is not None:
+        return logs
+    bucket = aws.s3.BucketV2("cloudfront-logs", force_destroy=True)
+    # CloudFront writes logs using ACLs
+    ownership = aws.s3.BucketOwnershipControls(
+        "cloudfront-logs",
+        bucket=bucket.id,
+        rule=aws.s3.BucketOwnershipControlsRuleArgs(
+            object_ownership="BucketOwnerPreferred",
+        ),
+    )
+    aws.s3.BucketLifecycleConfigurationV2(
+        "cloudfront-logs",
+        bucket=bucket.id,
+        rules=[
+            aws.s3.BucketLifecycleConfigurationV2RuleArgs(
+                id="expire",
+                status="Enabled",
+                expiration=aws.s3.BucketLifecycleConfigurationV2RuleExpirationArgs(
+                    days=30,
+                ),
+            )
+        ],
+    )
+    pulumi.export("cloudfront-logs", bucket.bucket)
+    logs = (bucket, ownership)
+    return logs
+
+
+def validation_records(domain, source, certificate):
+    """Records to validate a certificate, when zones are in another stack.
+
+    Otherwise, they are declared with the zone, see `Zone.cdn()`. The
+    stack of the zones only declares them, to push zones in bulk and
+    detect drift. `source` is the provider of the zone (`route53` or
+    the name of the Gandi key).
+    """
+    reference = stacks.reference("dns")
+    if reference is None:
+        return []
+    zone = domain.split(".", 1)[1]
+    option = certificate.domain_validation_options[0]
+    if source == "route53":
+        zones = reference.require_output("zones")
+        record = aws.route53.Record(
+            f"acm-{domain}",
+            zone_id=zones.apply(lambda x: x[f"route53:{zone}"]["zone_id"]),
+            name=option.resource_record_name,
+            type=option.resource_record_type,
+            ttl=86400,
+            records=[option.resource_record_value],
+            allow_overwrite=True,
+        )
+        return [record]
+    if source not in providers:
+        providers[source] = gandi.Provider(
+            source, key=pulumi.Config().require_secret(source)
+        )
+    record = gandi.livedns.Record(
+        f"acm-{domain}",
+        zone=zone,
+        name=option.resource_record_name.apply(lambda x: x.removesuffix(f".{zone}.")),
+        type=option.resource_record_type,
+        ttl=86400,
+        values=[option.resource_record_value],
+        opts=pulumi.ResourceOptions(provider=providers[source]),
+    )
+    return [record]
+
+
+def get_certificate(domain, source):
+    """ACM certificate for a distribution, validated through DNS."""
+    global us_east_1
+    if us_east_1 is None:
+        # CloudFront only uses certificates from us-east-1
+        us_east_1 = aws.Provider("us-east-1", region="us-east-1")
+    opts = pulumi.ResourceOptions(provider=us_east_1)
+    certificate = aws.acm.Certificate(
+        domain, domain_name=domain, validation_method="DNS", opts=opts
+    )
+    validation = aws.acm.CertificateValidation(
+        domain,
+        certificate_arn=certificate.arn,
+        opts=pulumi.ResourceOptions.merge(
+            opts,
+            pulumi.ResourceOptions(
+                depends_on=validation_records(domain, source, certificate)
+            ),
+        ),
+    )
+    return certificate, validation
+
+
+def main_region():
+    """AWS region closest to most web servers."""
+    regions = collections.Counter(
+        server["region"] for server in vm.register().tagged("web")
+    )
+    return regions.most_common(1)[0][0]
+
+
+def closest(servers, region):
+    """Servers sorted by proximity to an AWS region.
+
+    Servers in the same region come first, then servers in the same
+    area (`eu`, `us`...).
+    """
+    area = region.split("-")[0]
+    return sorted(
+        servers,
+        key=lambda server: (
+            server["region"] != region,
+            server["region"].split("-")[0] != area,
+            server["region"],
+            server["server"].name,
+        ),
+    )
+
+
+def origin_group(servers, region):
+    """Origin group with a primary and a secondary.
+
+    A distribution only has one default origin: the primary is the
+    server closest to `region` and the secondary is the server closest
+    to the primary. Return the group (`None` with only one server), the
+    origin to use by default and the servers used as origins.
+    """
+    primary, *others = closest(servers, region)
+    if not others:
+        return None, primary["server"].name, [primary]
+    secondary = closest(others, primary["region"])[0]
+    group = aws.cloudfront.DistributionOriginGroupArgs(
+        origin_id="group",
+        failover_criteria=aws.cloudfront.DistributionOriginGroupFailoverCriteriaArgs(
+            status_codes=[500, 502, 503, 504],
+        ),
+        members=[
+            aws.cloudfront.DistributionOriginGroupMemberArgs(
+                origin_id=primary["server"].name
+            ),
+            aws.cloudfront.DistributionOriginGroupMemberArgs(
+                origin_id=secondary["server"].name
+            ),
+        ],
+    )
+    return group, group.origin_id, [primary, secondary]
+
+
+def cloudfront_distribution(domain, source, origin_shield=None, logging=False):
+    """Cookie-less Cloudfront distribution.
+
+    When `origin_shield` is `True`, Origin Shield is enabled for each
+    origin in its closest region. It can also be a region. When
+    `logging` is `True`, standard logs are written to a shared bucket,
+    under the domain as a prefix. `source` is the DNS provider of the
+    zone of the domain, see `validation_records()`.
+
+    Two web servers are used directly as origins, close to the region
+    of Origin Shield or to most web servers. Connections are attempted
+    twice with a short timeout before failing over to the secondary
+    origin.
+
+    Return the distribution and its certificate.
+    """
+    cache_policy, origin_request_policy = get_policies()
+    region = isinstance(origin_shield, str) and origin_shield or main_region()
+    group, target, servers = origin_group(vm.register().tagged("web"), region)
+    logging_config = None
+    depends_on = []
+    if logging:
+        bucket, ownership = get_logs()
+        logging_config = aws.cloudfront.DistributionLoggingConfigArgs(
+            bucket=bucket.bucket_domain_name,
+            prefix=f"{domain}/",
+            include_cookies=False,
+        )
+        depends_on = [ownership]
+    certificate, validation = get_certificate(domain, source)
+    distribution = aws.cloudfront.Distribution(
         domain,
+        aliases=[domain],
         default_cache_behavior=aws.cloudfront.DistributionDefaultCacheBehaviorArgs(
             allowed_methods=[
                 "GET",
@@ -15,41 +290,43 @@ def cloudfront_distribution(domain):
                 "GET",
                 "HEAD",
             ],
-            target_origin_id="MyOrigin",
+            target_origin_id=target,
             viewer_protocol_policy="allow-all",
             compress=True,
-            min_ttl=0,
-            default_ttl=86400,
-            max_ttl=31536000,
-            forwarded_values=aws.cloudfront.DistributionDefaultCacheBehaviorForwardedValuesArgs(
-                # No cookies
-                cookies=aws.cloudfront.DistributionDefaultCacheBehaviorForwardedValuesCookiesArgs(
-                    forward="none",
-                    whitelisted_names=[],
-                ),
-                # Forward the "Accept" header
-                headers=["Accept"],
-                # No need for the query string
-                query_string=False,
-            ),
+            cache_policy_id=cache_policy.id,
+            origin_request_policy_id=origin_request_policy.id,
+            function_associations=get_functions(),
         ),
         enabled=True,
+        logging_config=logging_config,
         http_version="http2and3",
         is_ipv6_enabled=True,
+        origin_groups=group and [group] or [],
         origins=[
             aws.cloudfront.DistributionOriginArgs(
-                domain_name=domain,
-                origin_id="MyOrigin",
+                domain_name=server["server"].name,
+                origin_id=server["server"].name,
                 origin_path="",
+                connection_attempts=2,
+                connection_timeout=3,
                 custom_origin_config=aws.cloudfront.DistributionOriginCustomOriginConfigArgs(
                     http_port=80,
                     https_port=443,
-                    origin_keepalive_timeout=5,
+                    origin_keepalive_timeout=30,
                     origin_protocol_policy="https-only",
                     origin_read_timeout=30,
                     origin_ssl_protocols=["TLSv1.2"],
                 ),
+                origin_shield=aws.cloudfront.DistributionOriginOriginShieldArgs(
+                    enabled=True,
+                    origin_shield_region=origin_shield is True
+                    and server["region"]
+                    or origin_shield,
+                )
+                if origin_shield
+                else None,
             )
+            for server in servers
         ],
         price_class="PriceClass_All",
         restrictions=aws.cloudfront.DistributionRestrictionsArgs(
@@ -58,10 +335,75 @@ def cloudfront_distribution(domain):
             ),
         ),
         viewer_certificate=aws.cloudfront.DistributionViewerCertificateArgs(
-            cloudfront_default_certificate=True,
+            acm_certificate_arn=validation.certificate_arn,
+            ssl_support_method="sni-only",
+            minimum_protocol_version="TLSv1.2_2021",
+        ),
+        opts=pulumi.ResourceOptions(depends_on=depends_on),
+    )
+    return types.SimpleNamespace(
+        distribution=distribution, certificate=certificate, remote=False
+    )
+
+
+def remote(outputs, domain):
+    """Distribution and certificate exported by another stack.
+
+    The records validating the certificate are also created there.
+    """
+    output = outputs.apply(lambda x: x[domain])
+    return types.SimpleNamespace(
+        distribution=types.SimpleNamespace(
+            domain_name=output.apply(lambda x: x["domain_name"]),
+            hosted_zone_id=output.apply(lambda x: x["hosted_zone_id"]),
+        ),
+        certificate=types.SimpleNamespace(
+            domain_validation_options=[
+                types.SimpleNamespace(
+                    resource_record_name=output.apply(
+                        lambda x: x["validation"]["name"]
+                    ),
+                    resource_record_value=output.apply(
+                        lambda x: x["validation"]["value"]
+                    ),
+                )
+            ]
         ),
+        remote=True,
     )
 
 
-cloudfront_distribution("media.bernat.ch")
-cloudfront_distribution("media.une-oasis-une-ecole.fr")
+def register():
+    """Declare CloudFront distributions, indexed by domain."""
+    global distributions
+    if distributions is not None:
+        return distributions
+    # Domains with the DNS provider of their zone
+    domains = {
+        "media.bernat.ch": "route53",
+        "media.une-oasis-une-ecole.fr": "gandi-rb",
+    }
+    reference = stacks.reference("cloudfront")
+    if reference is not None:
+        outputs = reference.require_output("distributions")
+        distributions = {domain: remote(outputs, domain) for domain in domains}
+        return distributions
+    distributions = {
+        domain: cloudfront_distribution(
+            domain, source, origin_shield=True, logging=True
+        )
+        for domain, source in domains.items()
+    }
+    exported = {}
+    for domain, cdn in distributions.items():
+        validation = cdn.certificate.domain_validation_options[0]
+        exported[domain] = {
+            "domain_name": cdn.distribution.domain_name,
+            "hosted_zone_id": cdn.distribution.hosted_zone_id,
+            "validation": {
+                "name": validation.resource_record_name,
+                "value": validation.resource_record_value,
+            },
+        }
+    pulumi.export("distributions", exported)
+    return distributions
@@ -0,0 +1,191 @@
+"""Dynamic DNS updates for y.luffy.cx.
+
+Changes are read on stdin as `host type address` lines. A change is
+only published once the address has been stable for the debounce
+delay. Stable changes are sent as a single UPSERT batch per interval,
+and we wait for each batch to be in sync before sending the next one:
+
+    ip monitor address | ... | python -m luffy.ddns
+
+Credentials are the ones of the DDNS user. Use `--endpoint-url` to
+target a local stand-in, like moto in server mode.
+"""
+
+import sys
+import time
+import queue
+import argparse
+import ipaddress
+import threading
+
+import boto3
+import botocore.exceptions
+
+from . import route53
+
+
+class Updater:
+    """Collect changes and publish them in batches."""
+
+    def __init__(self, client, zone, zone_id, ttl=60, debounce=30, backoff=10):
+        self.client = client
+        self.zone = zone
+        self.zone_id = zone_id
+        self.ttl = ttl
+        self.debounce = debounce
+        self.backoff = backoff
+        self.failures = 0
+        self.retry = 0
+        self.pending = {}
+        self.published = {}
+
+    def fqdn(self, host):
+        host = host.rstrip(".")
+        if host != self.zone and not host.endswith(f".{self.zone}"):
+            host = f"{host}.{self.zone}"
+        return f"{host}."
+
+    def submit(self, host, rrtype, address, now):
+        """Record a change for a host."""
+        key = (self.fqdn(host), rrtype)
+        if self.published.get(key) == address:
+            # Flapped back to the published address
+            self.pending.pop(key, None)
+        elif self.pending.get(key, (None,))[0] != address:
+            self.pending[key] = (address, now)
+
+    def flush(self, now, force=False):
+        """Publish stable changes in one batch and wait for them.
+
+        When a batch fails (throttling, network), its changes stay
+        pending and are retried with an exponential backoff.
+        """
+        if not force and now < self.retry:
+            return None
+        ready = {
+            key: address
+            for key, (address, since) in self.pending.items()
+            if force or now - since >= self.debounce
+        }
+        if not ready:
+            return None
+        try:
+            change = self.send(ready)
+        except (
+            botocore.exceptions.BotoCoreError,
+            botocore.exceptions.ClientError,
+        ) as e:
+            self.failures += 1
+            self.retry = now + min(self.backoff * 2 ** (self.failures - 1), 300)
+            print(f"batch failed, retrying later: {e}", file=sys.stderr)
+            return None
+        self.failures = 0
+        return change
+
+    def send(self, ready):
+        """Send changes as one batch.
+
+        When Route53 rejects the batch, changes are sent one by one to
+        drop the invalid ones only.
+        """
+        try:
+            change = route53.change(
+                self.client,
+                self.zone_id,
+                [
+                    {
+                        "Action": "UPSERT",
+                        "ResourceRecordSet": {
+                            "Name": name,
+                            "Type": rrtype,
+                            "TTL": self.ttl,
+                            "ResourceRecords": [{"Value": address}],
+                        },
+                    }
+                    for (name, rrtype), address in sorted(ready.items())
+                ],
+                f"DDNS update for {len(ready)} records",
+            )
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "InvalidChangeBatch":
+                raise
+            if len(ready) > 1:
+                changes = [self.send({key: ready[key]}) for key in sorted(ready)]
+                return ", ".join(c for c in changes if c) or None
+            ((name, rrtype),) = ready
+            print(f"dropping {name} {rrtype}: {e}", file=sys.stderr)
+            del self.pending[name, rrtype]
+            return None
+        for key, address in ready.items():
+            self.published[key] = address
+            del self.pending[key]
+        return change
+
+
+def parse(line):
+    """Parse an input line as host, type and address."""
+    host, rrtype, address = line.split()
+    version = ipaddress.ip_address(address).version
+    if (rrtype, version) not in (("A", 4), ("AAAA", 6)):
+        raise ValueError(f"{address} is not a valid {rrtype} record")
+    return host, rrtype, address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dynamic DNS updates")
+    parser.add_argument("--zone", default="y.luffy.cx", help="zone to update")
+    parser.add_argument("--ttl", type=int, default=60, help="TTL of records")
+    parser.add_argument(
+        "--debounce", type=float, default=30, help="delay before publishing"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=10, help="delay between batches"
+    )
+    parser.add_argument("--endpoint-url", help="Route53 endpoint")
+    options = parser.parse_args()
+
+    client = boto3.client("route53", endpoint_url=options.endpoint_url)
+    updater = Updater(
+        client,
+        options.zone,
+        route53.zone_id(client, options.zone),
+        ttl=options.ttl,
+        debounce=options.debounce,
+    )
+
+    # Read stdin in a thread to publish on time
+    lines = queue.Queue()
+
+    def reader():
+        for line in sys.stdin:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=reader, daemon=True).start()
+    deadline = time.monotonic() + options.interval
+    while True:
+        try:
+            line = lines.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            line = ""
+        if line is None:
+            # End of input: publish everything
+            updater.flush(time.monotonic(), force=True)
+            if updater.pending:
+                print(f"{len(updater.pending)} changes not published", file=sys.stderr)
+                return 1
+            return 0
+        if line.strip():
+            try:
+                updater.submit(*parse(line), time.monotonic())
+            except ValueError as e:
+                print(f"ignoring {line.strip()!r}: {e}", file=sys.stderr)
+        if time.monotonic() >= deadline:
+            change = updater.flush(time.monotonic())
+            if change:
+                print(f"published {change}", file=sys.stderr)
+            deadline = time.monotonic() + options.interval
+
+
+if __name__ == "__main__":
+    sys.exit(main())
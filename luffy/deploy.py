@@ -0,0 +1,235 @@
+"""Deploy stacks with the Automation API.
+
+The program is first built with mocks to get the URN of each resource
+and a hash of its inputs. Only the resources whose hash changed since
+the last successful update are targeted. Outputs of referenced stacks
+are fed to the mocks, so a change in another stack is also detected.
+The stack is refreshed only when the last refresh is too old or when
+requested:
+
+    python -m luffy.deploy --stack dns --preview
+    python -m luffy.deploy --stack dns
+    python -m luffy.deploy --all           # vm+kms, then cdn, then dns
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import asyncio
+import hashlib
+import argparse
+import subprocess
+
+import pulumi
+from pulumi import automation as auto
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Stacks updated together, in order. Certificates of distributions are
+# validated by the cdn stack itself, see `cloudfront.validation_records()`.
+order = [["vm", "kms"], ["cdn"], ["dns"]]
+
+
+def reference(value):
+    """Stable representation of a resource used as input."""
+    if isinstance(value, pulumi.Resource):
+        return f"{value._type}::{value._name}"
+    return str(value)
+
+
+def digest(inputs):
+    """Hash of the inputs of a resource."""
+    data = json.dumps(inputs, sort_keys=True, default=reference)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def resources(stack, project, config, references):
+    """Build the program with mocks and hash inputs of each resource.
+
+    Resources are not parented, so URNs only contain their type.
+    """
+    from luffy import mocks
+
+    mocks.references.update(references)
+    result = mocks.run(
+        lambda: runpy.run_path(os.path.join(root, "__main__.py")), config
+    )
+    return {
+        f"urn:pulumi:{stack}::{project}::{r.typ}::{r.name}": digest(r.inputs)
+        for r in result.resources
+        if r.typ != "pulumi:pulumi:StackReference"
+    }
+
+
+def orphans(resources, desired):
+    """Gandi records left in the state for zones now pushed in bulk.
+
+    Deleting them once the zone is pushed would remove the records from
+    Gandi, as they have the same name and type.
+    """
+    bulk = {
+        urn.rsplit("::zone-", 1)[1]
+        for urn in desired
+        if "::pulumi-python:dynamic:Resource::zone-" in urn
+    }
+    return [
+        resource["urn"]
+        for resource in resources
+        if resource["type"] == "gandi:livedns/record:Record"
+        and resource.get("inputs", {}).get("zone") in bulk
+    ]
+
+
+class Deployment:
+    """Deployment of one stack."""
+
+    def __init__(self, name, refresh_after):
+        self.name = name
+        self.refresh_after = refresh_after
+        self.path = os.path.join(root, ".pulumi", f"luffy-deploy-{name}.json")
+        self.stack = auto.select_stack(stack_name=name, work_dir=root)
+        self.project = self.stack.workspace.project_settings().name
+
+    def log(self, line):
+        print(f"[{self.name}] {line.rstrip()}", flush=True)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, state):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def desired(self):
+        """URNs and hashes of the resources declared by the program."""
+        config = {k: v.value for k, v in self.stack.get_all_config().items()}
+        references = {}
+        for name in json.loads(config.get(f"{self.project}:stacks", "{}")).values():
+            outputs = auto.select_stack(stack_name=name, work_dir=root).outputs()
+            references[name] = {k: v.value for k, v in outputs.items()}
+        # Run in a separate process: modules keep state
+        output = subprocess.run(
+            [sys.executable, "-m", "luffy.deploy", "--resources", self.name],
+            input=json.dumps(
+                dict(project=self.project, config=config, references=references)
+            ),
+            cwd=root,
+            env={**os.environ, "LUFFY_CACHE": "off"},
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        return json.loads(output)
+
+    def changes(self, old, new):
+        """URNs of resources added, changed or removed."""
+        targets = []
+        for urn in sorted(set(old) | set(new)):
+            if urn not in new:
+                self.log(f"- {urn}")
+            elif urn not in old:
+                self.log(f"+ {urn}")
+            elif old[urn] != new[urn]:
+                self.log(f"~ {urn}")
+            else:
+                continue
+            targets.append(urn)
+        return targets
+
+    def run(self, preview=False, refresh=False):
+        state = self.load()
+        desired = self.desired()
+        deployment = self.stack.export_stack().deployment or {}
+        left = orphans(deployment.get("resources", []), desired)
+        if left:
+            for urn in left:
+                self.log(f"! {urn}")
+            raise RuntimeError(
+                f"{self.name}: remove individual Gandi records from the state first"
+            )
+        stale = time.time() - state.get("refreshed", 0) > self.refresh_after
+        if refresh or stale or "resources" not in state:
+            # Full update: state may have drifted
+            self.log("refresh and full update")
+            targets = None
+            refresh = True
+        else:
+            targets = self.changes(state["resources"], desired)
+            if not targets:
+                self.log("nothing to do")
+                return
+        if refresh:
+            # Also before a preview, which cannot refresh by itself
+            self.stack.refresh(on_output=self.log)
+            state["refreshed"] = time.time()
+            self.save(state)
+        if preview:
+            self.stack.preview(
+                target=targets, target_dependents=True, on_output=self.log
+            )
+            return
+        self.stack.up(target=targets, target_dependents=True, on_output=self.log)
+        state["resources"] = desired
+        self.save(state)
+
+
+def deploy(name, options):
+    Deployment(name, options.refresh_after).run(
+        preview=options.preview, refresh=options.refresh
+    )
+
+
+async def deploy_all(options):
+    """Deploy stacks, concurrently when they are independent."""
+    for group in order:
+        await asyncio.gather(
+            *(asyncio.to_thread(deploy, name, options) for name in group)
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="deploy stacks")
+    parser.add_argument("--stack", default="dev", help="stack to deploy")
+    parser.add_argument(
+        "--all", action="store_true", help="deploy vm, kms, cdn and dns stacks"
+    )
+    parser.add_argument("--preview", action="store_true", help="only preview")
+    parser.add_argument("--refresh", action="store_true", help="force a refresh")
+    parser.add_argument(
+        "--refresh-after",
+        type=int,
+        default=7 * 86400,
+        help="refresh when the last one is older (in seconds)",
+    )
+    parser.add_argument("--resources", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.resources:
+        data = json.load(sys.stdin)
+        json.dump(
+            resources(
+                options.resources,
+                data["project"],
+                data["config"],
+                data["references"],
+            ),
+            sys.stdout,
+        )
+        return 0
+
+    if options.all:
+        asyncio.run(deploy_all(options))
+    else:
+        deploy(options.stack, options)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,14 +7,80 @@ import pulumi
 import pulumi_aws as aws
 import pulumiverse_gandi as gandi
 
-from .kms import dns_cmk
-from .vm import all_servers
-
-gandi_vb = gandi.Provider("gandi-vb", key=pulumi.Config().get_secret("gandi-vb"))
-gandi_rb = gandi.Provider("gandi-rb", key=pulumi.Config().get_secret("gandi-rb"))
+from . import livedns, cache, kms, vm, cloudfront, instrument, drift
+
+pending = []
+zones = []
+# Shared name for web servers, routed by geolocation
+web = "web.luffy.cx"
+
+
+class RRsets:
+    """Table of RRsets of a zone.
+
+    Values for the same name/type are merged. Conflicts are detected
+    before any resource is created. When the name is only known later,
+    a label is used in its place to identify the RRset.
+    """
+
+    def __init__(self, zone):
+        self.zone = zone
+        self.rrsets = {}
+        self.types = {}
+
+    def __iter__(self):
+        return iter(self.rrsets.values())
+
+    def __len__(self):
+        return len(self.rrsets)
+
+    def add(self, name, rrtype, values, ttl, label=None, **more):
+        label = label or name
+        key = (label, rrtype, more.get("set_identifier"))
+        fqdn = label == "@" and self.zone or f"{label}.{self.zone}"
+        rrset = self.rrsets.get(key)
+        if rrset is None:
+            present = self.types.setdefault(label, set())
+            if present and "CNAME" in present | {rrtype}:
+                raise RuntimeError(f"{fqdn}: CNAME cannot coexist with other data")
+            present.add(rrtype)
+            self.rrsets[key] = rrset = types.SimpleNamespace(
+                name=name,
+                label=label,
+                type=rrtype,
+                ttl=ttl,
+                values=[],
+                more=more,
+                origin=instrument.context.get(),
+            )
+        elif rrset.ttl != ttl or rrset.more != more:
+            raise RuntimeError(f"{fqdn}: conflicting {rrtype} records")
+        if isinstance(values, pulumi.Output) or isinstance(rrset.values, pulumi.Output):
+            # Cannot merge values only known later
+            if rrset.values:
+                raise RuntimeError(f"{fqdn}: cannot merge {rrtype} records")
+            rrset.values = values
+        else:
+            rrset.values.extend(v for v in values if v not in rrset.values)
+        if (
+            rrtype == "CNAME"
+            and isinstance(rrset.values, list)
+            and len(rrset.values) > 1
+        ):
+            raise RuntimeError(f"{fqdn}: more than one CNAME")
+        return rrset
 
 
 class Zone(ABC):
+    def __init__(self, name):
+        self.name = name
+        self.rrsets = RRsets(name)
+        self.ksk = None
+        self.dynamic = False
+        self.external = set()
+        pending.append(self)
+        zones.append(self)
+
     def TXT(self, name, records, **kwargs):
         return self.record(name, "TXT", records, **kwargs)
 
@@ -46,16 +112,61 @@ class Zone(ABC):
         """Get key signing key."""
         pass
 
+    @instrument.helper
+    def record(
+        self, name, rrtype, records, ttl=86400, label=None, external=False, **more
+    ):
+        """Declare a record.
+
+        A label is needed when the name is an output. External records
+        are created by another stack: they are only pushed with the
+        zone in bulk mode and checked for drift.
+        """
+        if type(records) is str:
+            records = [records]
+        rrset = self.rrsets.add(name, rrtype, records, ttl, label, **more)
+        if external:
+            self.external.add((rrset.label, rrtype))
+        return self
+
     @abstractmethod
-    def record(self, name, rrtype, records, ttl=86400):
-        """Create a record."""
+    def create(self, rrset):
+        """Create the resource for a RRset."""
         pass
 
+    def lines(self, rrset):
+        """Canonical lines for a RRset."""
+        return pulumi.Output.all(rrset.name, rrset.values).apply(
+            lambda args: [
+                drift.line(drift.fqdn(self.name, args[0]), rrset.ttl, rrset.type, v)
+                for v in args[1]
+            ]
+        )
+
+    def export(self):
+        """Declared records, to detect drift."""
+        return {
+            "records": pulumi.Output.all(
+                *(self.lines(rrset) for rrset in self.rrsets)
+            ).apply(lambda lines: sorted({line for rr in lines for line in rr})),
+            "dynamic": self.dynamic,
+        }
+
+    def materialize(self):
+        """Create resources for all declared records."""
+        for rrset in self.rrsets:
+            if (rrset.label, rrset.type) in self.external:
+                continue
+            with instrument.scope(rrset.origin):
+                self.create(rrset)
+        return self
+
     @abstractmethod
     def sign(self):
         """Sign the zone."""
         pass
 
+    @instrument.helper
     def registrar(self, provider, dnssec=True):
         """Register zone to Gandi."""
         gandi.domains.Nameservers(
@@ -76,6 +187,7 @@ class Zone(ABC):
             )
         return self
 
+    @instrument.helper
     def fastmail_mx(self, subdomains=[]):
         """Create records for MX with FastMail."""
         for subdomain in subdomains + ["@", "*"]:
@@ -92,6 +204,7 @@ class Zone(ABC):
         self.TXT("_dmarc", "v=DMARC1; p=none; sp=none")
         return self
 
+    @instrument.helper
     def fastmail_services(self):
         """Create service records for Fastmail."""
         self.SRV("_submission._tcp", "0 1 587 smtp.fastmail.com.")
@@ -100,70 +213,233 @@ class Zone(ABC):
             self.SRV(f"_{service}s._tcp", f"0 1 {port} {service}.fastmail.com.")
         return self
 
-    def www(self, name, **kwargs):
-        """Create records for web servers."""
+    @instrument.helper
+    def www(self, name, shared=True, **kwargs):
+        """Create records for web servers.
+
+        Except at the apex, with a specific routing or when `shared` is
+        false (the name has other records), the name is a CNAME to the
+        shared name for web servers, which also holds the CAA records.
+        """
+        if name != "@" and shared and not kwargs:
+            self.CNAME(name, f"{web}.")
+            return self.acme_challenge(name)
         ttl = 60 * 60 * 2
-        servers = {
-            server["server"].name: {
-                "A": server["server"].ipv4_address,
-                "AAAA": server["server"].ipv6_address,
-                "geolocations": server["geolocations"],
-            }
-            for server in all_servers
-            if not server.get("disabled") and "web" in server.get("tags", [])
-        }
-        self.www_A_AAAA(name, servers, ttl, **kwargs)
+        plan = RoutingPlan.get(vm.register(), "web")
+        self.www_A_AAAA(name, plan, ttl, **kwargs)
         self.record(name, "CAA", ['0 issue "buypass.com"', '0 issuewild ";"'])
+        return self.acme_challenge(name)
+
+    @instrument.helper
+    def delegate(self, name, zone):
+        """Delegate a subdomain to a signed Route53 zone."""
+        self.NS(
+            name,
+            records=zone.get_nameservers().apply(lambda rrs: [f"{r}." for r in rrs]),
+        )
+        return self.record(name, "DS", records=[zone.ksk.ds_record])
+
+    def acme_challenge(self, name):
+        """Delegate ACME challenges for a name to acme.luffy.cx."""
         if name == "@":
             self.CNAME("_acme-challenge", f"{self.name}.acme.luffy.cx.")
         else:
             self.CNAME(f"_acme-challenge.{name}", f"{name}.{self.name}.acme.luffy.cx.")
         return self
 
-    def www_A_AAAA(self, name, servers, ttl, geolocation=False):
-        """Create A/AAAA records for servers."""
-        assert not geolocation, "cannot handle geolocation request"
+    @instrument.helper
+    def cdn(self, name, cdn):
+        """Create records for a CloudFront distribution.
+
+        `cdn` is one of the values returned by `cloudfront.register()`.
+        When it comes from another stack, the record validating its
+        certificate is created there. Web servers still need ACME
+        challenges as they are the origins.
+        """
+        self.cdn_A_AAAA(name, cdn.distribution)
+        option = cdn.certificate.domain_validation_options[0]
+        self.CNAME(
+            option.resource_record_name.apply(
+                lambda x: x.removesuffix(f".{self.name}.")
+            ),
+            option.resource_record_value.apply(lambda x: [x]),
+            label=name == "@" and "_acm" or f"_acm.{name}",
+            external=cdn.remote,
+        )
+        return self.acme_challenge(name)
+
+    def cdn_A_AAAA(self, name, distribution):
+        """Point a name to a CloudFront distribution.
+
+        Aliases are not supported: a CNAME is used instead. As CAA
+        records are looked up from the apex, Amazon is allowed there.
+        """
+        if name == "@":
+            raise RuntimeError(f"{self.name}: cannot use a CNAME at the apex")
+        self.CNAME(name, distribution.domain_name.apply(lambda x: [f"{x}."]))
+        self.record("@", "CAA", ['0 issue "amazon.com"'])
+        return self
+
+    def www_A_AAAA(self, name, plan, ttl, routing=None):
+        """Create A/AAAA records for servers.
+
+        Routing policies are not supported: all servers are returned.
+        """
         for rrtype in ("A", "AAAA"):
-            self.record(
-                name,
-                rrtype,
-                [servers[server][rrtype] for server in servers],
-                ttl=ttl,
-            )
+            self.record(name, rrtype, plan.records[plan.default][rrtype], ttl=ttl)
         return self
 
 
-class MultiZone:
-    def __init__(self, *zones):
-        self.zones = zones
+class RoutingPlan:
+    """Geolocation routing plan for a pool of servers.
+
+    Servers are indexed by geolocation and A/AAAA values are resolved
+    once. Plans are shared by all zones and kept with their inventory.
+    Building a plan fails when a geolocation is not covered by enough
+    servers.
+    """
+
+    default = ("country", "*")
+
+    @classmethod
+    def get(cls, inventory, tag):
+        if tag not in inventory.plans:
+            inventory.plans[tag] = cls(inventory, tag)
+        return inventory.plans[tag]
+
+    def __init__(self, inventory, tag):
+        servers = inventory.pool(tag).servers
+        index = {self.default: servers}
+        for server in servers:
+            for kind, codes in server["geolocations"]:
+                for code in codes:
+                    if (kind, code) not in index:
+                        index[kind, code] = [
+                            server
+                            for server in inventory.located(kind, code)
+                            if tag in server["tags"]
+                        ]
+        self.geolocations = sorted(index)
+        self.records = {
+            geoloc: {
+                "A": [server["server"].ipv4_address for server in index[geoloc]],
+                "AAAA": [server["server"].ipv6_address for server in index[geoloc]],
+            }
+            for geoloc in self.geolocations
+        }
+        self.members = index
+        self.servers = servers
+        self.regions = {}
+        for server in servers:
+            self.regions.setdefault(server["region"], []).append(server)
+        self.tag = tag
+        self.health_checks = {}
+
+    def pool(self, geoloc):
+        """Name of the weighted records for a geolocation."""
+        kind, code = geoloc
+        if geoloc == self.default:
+            return f"default._{self.tag}"
+        return f"{kind}-{code.lower()}._{self.tag}"
+
+    def regional(self, region):
+        """Name of the multivalue records for an AWS region."""
+        return f"latency-{region}._{self.tag}"
+
+    def health_check(self, server, rrtype="A"):
+        """Get health check for a server, for the address of the given type."""
+        name = server["server"].name
+        key = (name, rrtype)
+        if key not in self.health_checks:
+            self.health_checks[key] = aws.route53.HealthCheck(
+                rrtype == "A" and f"health-{name}" or f"health6-{name}",
+                fqdn=name,
+                ip_address=rrtype == "A"
+                and server["server"].ipv4_address
+                or server["server"].ipv6_address,
+                port=443,
+                type="HTTPS",
+                resource_path="/",
+                enable_sni=True,
+                request_interval=30,
+                failure_threshold=3,
+                tags={"Name": rrtype == "A" and name or f"{name} (IPv6)"},
+            )
+        return self.health_checks[key]
 
-    def __getattribute__(self, attr):
-        if attr.startswith("__"):
-            return object.__getattribute__(self, attr)
-        zones = object.__getattribute__(self, "zones")
-        val = getattr(zones[0], attr)
-        if callable(val):
 
-            def wrapper(*args, **kwargs):
-                for zone in zones:
-                    getattr(zone, attr)(*args, **kwargs)
-                return self
+class MultiZone:
+    def __init__(self, *zones):
+        """Replay calls on several zones.
 
-            return wrapper
-        return val
+        Calls are recorded and replayed once on each zone by
+        `materialize()`.
+        """
+        self.zones = zones
+        self.calls = []
+        for zone in zones:
+            pending.remove(zone)
+        pending.append(self)
+
+    def __getattr__(self, attr):
+        val = getattr(self.zones[0], attr)
+        if not callable(val):
+            return val
+
+        def wrapper(*args, **kwargs):
+            self.calls.append((attr, args, kwargs))
+            return self
+
+        setattr(self, attr, wrapper)
+        return wrapper
+
+    def materialize(self):
+        """Replay recorded calls and create resources for each zone."""
+        for zone in self.zones:
+            for attr, args, kwargs in self.calls:
+                getattr(zone, attr)(*args, **kwargs)
+            zone.materialize()
+        return self
 
 
 class GandiZone(Zone):
-    def __init__(self, name, provider, **kwargs):
-        """Manage a zone on Gandi LiveDNS."""
-        self.name = name
+    # Record types supported by LiveDNS, for secondary zones
+    supported = {
+        "A",
+        "AAAA",
+        "CAA",
+        "CNAME",
+        "DS",
+        "MX",
+        "NAPTR",
+        "NS",
+        "PTR",
+        "SPF",
+        "SRV",
+        "SSHFP",
+        "TLSA",
+        "TXT",
+    }
+
+    def __init__(self, name, provider, key=None, **kwargs):
+        """Manage a zone on Gandi LiveDNS.
+
+        When an API key is provided, records are collected and pushed
+        in bulk by `materialize()`.
+        """
+        super().__init__(name)
         self.provider = provider
-        self.ksk = None
+        self.key = key
+        self.source = provider._name
 
     def get_nameservers(self):
-        return gandi.livedns.get_domain_nameserver(
-            name=self.name, opts=pulumi.InvokeOptions(provider=self.provider)
-        ).nameservers
+        return cache.cached(
+            f"gandi-nameservers:{self.name}",
+            lambda: gandi.livedns.get_domain_nameserver_output(
+                name=self.name, opts=pulumi.InvokeOptions(provider=self.provider)
+            ).nameservers,
+            config=["gandi-vb", "gandi-rb"],
+        )
 
     def get_ksk(self):
         if not self.ksk:
@@ -172,23 +448,108 @@ class GandiZone(Zone):
             public_key=self.ksk.public_key, signing_algorithm=self.ksk.algorithm
         )
 
-    def record(self, name, rrtype, records, ttl=86400):
-        """Create a record."""
-        if type(records) is str:
-            records = [records]
-        if rrtype == "TXT":
-            records = [f'"{r}"' for r in records]
+    @instrument.helper
+    def derive(self, primary):
+        """Declare the records of a primary zone.
+
+        Routing policies are flattened: only the default geolocation
+        set is kept (all sets when there is none) and values of other
+        sets are merged. Aliases become CNAME, except at the apex. CAA
+        records of an aliased name are moved to the apex, other records
+        there are dropped, as well as unsupported types.
+        """
+        groups = {}
+        for rrset in primary.rrsets:
+            groups.setdefault((rrset.label, rrset.type), []).append(rrset)
+        aliased = {
+            label
+            for (label, _), rrsets in groups.items()
+            if any(rrset.more.get("aliases") for rrset in rrsets)
+        }
+        default = [dict([RoutingPlan.default])]
+        for (label, rrtype), rrsets in groups.items():
+            fqdn = label == "@" and self.name or f"{label}.{self.name}"
+            if rrtype not in self.supported:
+                pulumi.log.warn(f"{fqdn}: {rrtype} records not supported on Gandi")
+                continue
+            rrsets = [
+                rrset
+                for rrset in rrsets
+                if rrset.more.get("geolocation_routing_policies") == default
+            ] or rrsets
+            if label == "@" and label in aliased:
+                pulumi.log.warn(f"{fqdn}: cannot use a CNAME at the apex")
+                continue
+            if label in aliased:
+                aliases = [a for rrset in rrsets for a in rrset.more.get("aliases", [])]
+                if aliases and "CNAME" not in self.rrsets.types.get(label, ()):
+                    self.CNAME(
+                        rrsets[0].name,
+                        pulumi.Output.from_input(aliases[0].name).apply(
+                            lambda x: [f"{x.removesuffix('.')}."]
+                        ),
+                        label=label,
+                    )
+                elif rrtype == "CAA":
+                    for rrset in rrsets:
+                        self.record("@", "CAA", rrset.values, ttl=rrset.ttl)
+                elif not aliases:
+                    pulumi.log.warn(f"{fqdn}: {rrtype} records hidden by a CNAME")
+                continue
+            for rrset in rrsets:
+                self.record(
+                    rrset.name, rrtype, rrset.values, ttl=rrset.ttl, label=label
+                )
+        return self
+
+    def values(self, rrset):
+        if rrset.more:
+            raise RuntimeError(f"{rrset.name}.{self.name}: unsupported routing")
+        if rrset.type == "TXT":
+            return [f'"{r}"' for r in rrset.values]
+        return rrset.values
+
+    def create(self, rrset):
         gandi.livedns.Record(
-            f"{rrtype}-{name}.{self.name}",
+            f"{rrset.type}-{rrset.label}.{self.name}",
             zone=self.name,
-            name=name,
-            type=rrtype,
-            ttl=ttl,
-            values=records,
+            name=rrset.name,
+            type=rrset.type,
+            ttl=rrset.ttl,
+            values=self.values(rrset),
             opts=pulumi.ResourceOptions(provider=self.provider),
         )
+
+    def lines(self, rrset):
+        return super().lines(
+            types.SimpleNamespace(**{**vars(rrset), "values": self.values(rrset)})
+        )
+
+    def materialize(self):
+        """Create resources for all declared records.
+
+        In bulk mode, all records are pushed with a single resource.
+        """
+        if self.key is None:
+            return super().materialize()
+        with instrument.scope((self.name, "materialize")):
+            livedns.ZoneRecords(
+                self.name,
+                zone=self.name,
+                rrsets=[
+                    {
+                        "rrset_name": rrset.name,
+                        "rrset_type": rrset.type,
+                        "rrset_ttl": rrset.ttl,
+                        "rrset_values": self.values(rrset),
+                    }
+                    for rrset in self.rrsets
+                ],
+                key=self.key,
+            )
         return self
 
+    @instrument.helper
     def sign(self):
         """Sign the zone."""
         self.ksk = gandi.livedns.Key(
@@ -200,10 +561,12 @@ class GandiZone(Zone):
 
 
 class Route53Zone(Zone):
+    source = "route53"
+
     def __init__(self, name, **kwargs):
-        self.name = name
+        super().__init__(name)
         self.zone = aws.route53.Zone(name, name=name, **kwargs)
-        self.ksk = None
+        self.secondaries = []
 
     def get_nameservers(self):
         return self.zone.name_servers
@@ -216,70 +579,200 @@ class Route53Zone(Zone):
             signing_algorithm=self.ksk.signing_algorithm_type,
         )
 
-    def record(self, name, rrtype, records, ttl=86400, **more):
-        """Create a record."""
-        if name == "@":
+    def create(self, rrset):
+        if rrset.label == "@":
+            label = self.name
+        else:
+            label = f"{rrset.label}.{self.name}"
+        if not isinstance(rrset.name, str):
+            name = pulumi.Output.concat(rrset.name, ".", self.name)
+        elif rrset.name == "@":
             name = self.name
         else:
-            name = f"{name}.{self.name}"
-        if type(records) is str:
-            records = [records]
+            name = f"{rrset.name}.{self.name}"
+        more = rrset.more
         aws.route53.Record(
-            f"{rrtype}-{more['set_identifier']}-{name}"
+            f"{rrset.type}-{more['set_identifier']}-{label}"
             if more.get("set_identifier")
-            else f"{rrtype}-{name}",
+            else f"{rrset.type}-{label}",
             zone_id=self.zone.zone_id,
-            name=f"{name}",
-            type=rrtype,
-            ttl=ttl,
-            records=records,
+            name=name,
+            type=rrset.type,
+            ttl=rrset.ttl,
+            records=rrset.values or None,
             **more,
         )
+
+    def lines(self, rrset):
+        more = rrset.more
+        aliases = [
+            dict(name=alias.name, zone_id=alias.zone_id)
+            for alias in more.get("aliases", [])
+        ]
+        return pulumi.Output.all(
+            rrset.name,
+            rrset.values,
+            aliases,
+            (more.get("geolocation_routing_policies") or [{}])[0],
+            (more.get("latency_routing_policies") or [{}])[0].get("region"),
+            more.get("health_check_id"),
+            (more.get("weighted_routing_policies") or [{}])[0].get("weight"),
+            more.get("multivalue_answer_routing_policy"),
+        ).apply(
+            lambda args: [
+                drift.line(
+                    drift.fqdn(self.name, args[0]),
+                    rrset.ttl,
+                    rrset.type,
+                    value,
+                    drift.routing(more.get("set_identifier"), *args[3:]),
+                )
+                for value in args[1]
+                + [drift.alias(alias["name"], alias["zone_id"]) for alias in args[2]]
+            ]
+        )
+
+    def export(self):
+        return {**super().export(), "zone_id": self.zone.zone_id}
+
+    def secondary(self, zone):
+        """Derive a Gandi zone from this one.
+
+        Its records are declared from the records of this zone when
+        materialized, see `GandiZone.derive()`. They are always pushed
+        in bulk, with the API key of the zone.
+        """
+        if zone.key is None:
+            raise RuntimeError(f"{zone.name}: secondary zone without an API key")
+        pending.remove(zone)
+        self.secondaries.append(zone)
+        return self
+
+    def materialize(self):
+        """Create resources for all declared records and secondary zones."""
+        super().materialize()
+        for zone in self.secondaries:
+            zone.derive(self).materialize()
+        return self
+
+    def cdn_A_AAAA(self, name, distribution):
+        """Point a name to a CloudFront distribution, using aliases."""
+        for rrtype in ("A", "AAAA"):
+            self.record(
+                name,
+                rrtype,
+                [],
+                ttl=None,
+                aliases=[
+                    aws.route53.RecordAliasArgs(
+                        name=distribution.domain_name,
+                        zone_id=distribution.hosted_zone_id,
+                        evaluate_target_health=False,
+                    )
+                ],
+            )
+        self.record(
+            name,
+            "CAA",
+            ['0 issue "buypass.com"', '0 issue "amazon.com"', '0 issuewild ";"'],
+        )
         return self
 
-    def www_A_AAAA(self, name, servers, ttl, geolocation=True):
-        """Create records for web servers."""
-        if geolocation:
-            # Normalize the data a bit
-            geolocations = set()
-            for server, data in servers.items():
-                data["geolocations"] = [
-                    (k, v1) for k, v in data["geolocations"] for v1 in v
-                ]
-            # Build geolocation sets
-            geolocations = {
-                geoloc for data in servers.values() for geoloc in data["geolocations"]
-            }
-            # Compute records for each location
-            rrs = {}
-            rrs[("country", "*")] = servers.keys()
-            for geoloc in geolocations:
-                rrs[geoloc] = [
-                    server
-                    for server, data in servers.items()
-                    if geoloc in data["geolocations"]
-                ]
-            # Create records for Route53
+    def www_A_AAAA(self, name, plan, ttl, routing="geolocation"):
+        """Create records for web servers.
+
+        With geolocation routing, servers are selected by continent.
+        With weighted routing, they are then weighted by their
+        capacity: each geolocation is an alias to weighted records
+        shared by all names of the zone. With latency routing, each
+        AWS region is an alias to multivalue records shared by all
+        names of the zone, one per server, backed by a health check
+        for each address. When all servers of a region are unhealthy,
+        the next closest region is used.
+        """
+        if routing == "geolocation":
             for rrtype in ("A", "AAAA"):
-                for geoloc, selected_servers in rrs.items():
+                for geoloc in plan.geolocations:
                     self.record(
                         name,
                         rrtype,
-                        [servers[server][rrtype] for server in selected_servers],
+                        plan.records[geoloc][rrtype],
                         ttl=ttl,
                         set_identifier=f"geo-{geoloc[0]}-{geoloc[1]}",
                         geolocation_routing_policies=[dict([geoloc])],
                     )
+        elif routing == "weighted":
+            for rrtype, attr in (("A", "ipv4_address"), ("AAAA", "ipv6_address")):
+                for geoloc in plan.geolocations:
+                    pool = plan.pool(geoloc)
+                    for server in plan.members[geoloc]:
+                        self.record(
+                            pool,
+                            rrtype,
+                            [getattr(server["server"], attr)],
+                            ttl=ttl,
+                            set_identifier=server["server"].name,
+                            weighted_routing_policies=[
+                                dict(weight=server.get("capacity", 1))
+                            ],
+                        )
+                    self.record(
+                        name,
+                        rrtype,
+                        [],
+                        ttl=None,
+                        set_identifier=f"geo-{geoloc[0]}-{geoloc[1]}",
+                        geolocation_routing_policies=[dict([geoloc])],
+                        aliases=[
+                            aws.route53.RecordAliasArgs(
+                                name=f"{pool}.{self.name}",
+                                zone_id=self.zone.zone_id,
+                                evaluate_target_health=False,
+                            )
+                        ],
+                    )
+        elif routing == "latency":
+            for rrtype, attr in (("A", "ipv4_address"), ("AAAA", "ipv6_address")):
+                for region, servers in sorted(plan.regions.items()):
+                    pool = plan.regional(region)
+                    for server in servers:
+                        self.record(
+                            pool,
+                            rrtype,
+                            [getattr(server["server"], attr)],
+                            ttl=ttl,
+                            set_identifier=server["server"].name,
+                            multivalue_answer_routing_policy=True,
+                            health_check_id=plan.health_check(server, rrtype).id,
+                        )
+                    self.record(
+                        name,
+                        rrtype,
+                        [],
+                        ttl=None,
+                        set_identifier=f"latency-{region}",
+                        latency_routing_policies=[dict(region=region)],
+                        aliases=[
+                            aws.route53.RecordAliasArgs(
+                                name=f"{pool}.{self.name}",
+                                zone_id=self.zone.zone_id,
+                                evaluate_target_health=True,
+                            )
+                        ],
+                    )
+        elif routing is None:
+            return super().www_A_AAAA(name, plan, ttl)
         else:
-            super()._www(name, servers, ttl)
+            raise RuntimeError(f"unknown routing policy {routing}")
         return self
 
+    @instrument.helper
     def sign(self):
         """Sign a zone."""
         self.ksk = aws.route53.KeySigningKey(
             self.name,
             hosted_zone_id=self.zone.zone_id,
-            key_management_service_arn=dns_cmk.target_key_arn,
+            key_management_service_arn=kms.register().target_key_arn,
             name=re.sub(r"[^0-9a-zA-Z]", "", self.name),
             status="ACTIVE",
         )
@@ -291,8 +784,10 @@ class Route53Zone(Zone):
         )
         return self
 
+    @instrument.helper
     def allow_user(self, user_name):
         """Create a user allowed to make modifications to the zone."""
+        self.dynamic = True
         user = aws.iam.User(user_name, name=user_name, path="/")
         aws.iam.UserPolicy(
             f"{user_name}-{self.name}",
@@ -325,74 +820,107 @@ class Route53Zone(Zone):
         return self
 
 
-# enxio.fr/enx.io (on Gandi)
-zone = MultiZone(
-    GandiZone("enxio.fr", gandi_vb).sign().registrar(gandi_vb),
-    GandiZone("enx.io", gandi_vb).sign().registrar(gandi_vb),
-)
-zone.www("@").www("www").www("media")
-zone.fastmail_mx()
-
-# une-oasis-une-ecole.fr (on Gandi)
-zone = GandiZone("une-oasis-une-ecole.fr", gandi_rb).sign().registrar(gandi_rb)
-zone.www("@").www("www").www("media")
-zone.MX("@", ["10 spool.mail.gandi.net.", "50 fb.mail.gandi.net."])
-zone.TXT(
-    "@",
-    [
-        "google-site-verification=_GFUTYZ19KcdCDA26QfZI_w3oWDJoQyD5GyZ6a-ieh8",
-        "v=spf1 include:_mailcust.gandi.net include:spf.mailjet.com ?all",
-    ],
-)
-zone.TXT(
-    "mailjet._domainkey",
-    "k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQDWsJlP6+qLJS/RLvoNrMPRPrfzcQAuvZ1vUIJkqGauJ23zowQ9ni44XqzYyiBPx00c0QCQhO7oBEhnTeVGMcIfzNASeofZDfiu2dk7iOARpBeKT+EPJtXKS8cW0nz6cusANW7Mxa1Or1sUeV5+J0jFSAmeqWjginJPHJri7ZDA6QIDAQAB",
-)
-
-# bernat.im (not signed), on Route53, backup on Gandi
-zone = MultiZone(
-    Route53Zone("bernat.im").registrar(gandi_vb, dnssec=False),
-    GandiZone("bernat.im", gandi_vb),
-)
-zone.www("@").www("vincent")
-zone.fastmail_mx()
-
-# bernat.ch, on Route 53, backup on Gandi
-zone = MultiZone(
-    Route53Zone("bernat.ch").sign().registrar(gandi_vb),
-    GandiZone("bernat.ch", gandi_vb).sign(),
-)
-zone.www("@").www("vincent").www("media")
-zone.CNAME("4unklrhyt7lw.vincent", "gv-qcgpdhlvhtgedt.dv.googlehosted.com.")
-zone.fastmail_mx(subdomains=["vincent"]).fastmail_services()
-
-# luffy.cx, on Gandi
-zone = luffy_cx = GandiZone("luffy.cx", gandi_vb).sign().registrar(gandi_vb)
-zone.fastmail_mx()
-zone.www("@").www("media").www("www").www("haproxy")
-zone.CNAME("comments", "web03.luffy.cx.")
-zone.CNAME("eizo", "eizo.y.luffy.cx.")
-for server in all_servers:
-    name = server["server"].name
-    if not name.endswith(".luffy.cx"):
-        continue
-    name = name.removesuffix(".luffy.cx")
-    zone.A(name, [server["server"].ipv4_address])
-    zone.AAAA(name, [server["server"].ipv6_address])
-
-# y.luffy.cx (DDNS), on Route53
-zone = Route53Zone("y.luffy.cx").sign()
-luffy_cx.NS(
-    "y", records=zone.get_nameservers().apply(lambda rrs: [f"{r}." for r in rrs])
-)
-luffy_cx.record("y", "DS", records=[zone.ksk.ds_record])
-zone.allow_user("DDNS")
-
-# acme.luffy.cx (ACME DNS-01 challenges), on Route53
-zone = Route53Zone("acme.luffy.cx").sign()
-luffy_cx.NS(
-    "acme", records=zone.get_nameservers().apply(lambda rrs: [f"{r}." for r in rrs])
-)
-luffy_cx.record("acme", "DS", records=[zone.ksk.ds_record])
-zone.allow_user("ACME")
-pulumi.export("acme-zone", zone.zone.zone_id)
+def register():
+    """Declare DNS zones."""
+    config = pulumi.Config()
+    cdn = cloudfront.register()
+    gandi_vb_key = config.get_secret("gandi-vb")
+    gandi_rb_key = config.get_secret("gandi-rb")
+    gandi_vb = gandi.Provider("gandi-vb", key=gandi_vb_key)
+    gandi_rb = gandi.Provider("gandi-rb", key=gandi_rb_key)
+    # Secondary zones are always pushed with one call
+    secondary_key = gandi_vb_key
+    # In bulk mode, Gandi zones are pushed with one call each
+    if not config.get_bool("gandi-bulk"):
+        gandi_vb_key = gandi_rb_key = None
+
+    # enxio.fr/enx.io (on Gandi)
+    zone = MultiZone(
+        GandiZone("enxio.fr", gandi_vb, gandi_vb_key).sign().registrar(gandi_vb),
+        GandiZone("enx.io", gandi_vb, gandi_vb_key).sign().registrar(gandi_vb),
+    )
+    zone.www("@").www("www").www("media")
+    zone.fastmail_mx()
+
+    # une-oasis-une-ecole.fr (on Gandi)
+    zone = (
+        GandiZone("une-oasis-une-ecole.fr", gandi_rb, gandi_rb_key)
+        .sign()
+        .registrar(gandi_rb)
+    )
+    zone.www("@").www("www").cdn("media", cdn["media.une-oasis-une-ecole.fr"])
+    zone.MX("@", ["10 spool.mail.gandi.net.", "50 fb.mail.gandi.net."])
+    zone.TXT(
+        "@",
+        [
+            "google-site-verification=_GFUTYZ19KcdCDA26QfZI_w3oWDJoQyD5GyZ6a-ieh8",
+            "v=spf1 include:_mailcust.gandi.net include:spf.mailjet.com ?all",
+        ],
+    )
+    zone.TXT(
+        "mailjet._domainkey",
+        "k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQDWsJlP6+qLJS/RLvoNrMPRPrfzcQAuvZ1vUIJkqGauJ23zowQ9ni44XqzYyiBPx00c0QCQhO7oBEhnTeVGMcIfzNASeofZDfiu2dk7iOARpBeKT+EPJtXKS8cW0nz6cusANW7Mxa1Or1sUeV5+J0jFSAmeqWjginJPHJri7ZDA6QIDAQAB",
+    )
+
+    # bernat.im (not signed), on Route53, backup on Gandi
+    zone = (
+        Route53Zone("bernat.im")
+        .registrar(gandi_vb, dnssec=False)
+        .secondary(GandiZone("bernat.im", gandi_vb, secondary_key))
+    )
+    zone.www("@").www("vincent")
+    zone.fastmail_mx()
+
+    # bernat.ch, on Route 53, backup on Gandi
+    zone = (
+        Route53Zone("bernat.ch")
+        .sign()
+        .registrar(gandi_vb)
+        .secondary(GandiZone("bernat.ch", gandi_vb, secondary_key).sign())
+    )
+    zone.www("@").www("vincent", shared=False).cdn("media", cdn["media.bernat.ch"])
+    zone.CNAME("4unklrhyt7lw.vincent", "gv-qcgpdhlvhtgedt.dv.googlehosted.com.")
+    zone.fastmail_mx(subdomains=["vincent"]).fastmail_services()
+
+    # luffy.cx, on Gandi
+    zone = luffy_cx = (
+        GandiZone("luffy.cx", gandi_vb, gandi_vb_key).sign().registrar(gandi_vb)
+    )
+    zone.fastmail_mx()
+    zone.www("@").www("media").www("www").www("haproxy")
+    zone.CNAME("comments", "web03.luffy.cx.")
+    zone.CNAME("eizo", "eizo.y.luffy.cx.")
+    for server in vm.register():
+        name = server["server"].name
+        if not name.endswith(".luffy.cx"):
+            continue
+        name = name.removesuffix(".luffy.cx")
+        zone.A(name, [server["server"].ipv4_address])
+        zone.AAAA(name, [server["server"].ipv6_address])
+
+    # web.luffy.cx (shared name for web servers), on Route53
+    zone = Route53Zone(web).sign()
+    luffy_cx.delegate("web", zone)
+    zone.www("@", routing="weighted")
+
+    # y.luffy.cx (DDNS), on Route53
+    zone = Route53Zone("y.luffy.cx").sign()
+    luffy_cx.delegate("y", zone)
+    zone.allow_user("DDNS")
+
+    # acme.luffy.cx (ACME DNS-01 challenges), on Route53
+    zone = Route53Zone("acme.luffy.cx").sign()
+    luffy_cx.delegate("acme", zone)
+    zone.allow_user("ACME")
+    pulumi.export("acme-zone", zone.zone.zone_id)
+
+    materialize()
+    pulumi.export(
+        "zones", {f"{zone.source}:{zone.name}": zone.export() for zone in zones}
+    )
+
+
+def materialize():
+    """Create resources for all pending zones."""
+    while pending:
+        pending.pop(0).materialize()
@@ -0,0 +1,254 @@
+"""Detect drift of DNS zones without a refresh.
+
+Each zone exports its declared records as canonical lines (`zones`
+stack output). Live zones are fetched with a single LiveDNS call or a
+paginated ListResourceRecordSets and canonicalized the same way. Only
+zones whose hash differs are compared line by line:
+
+    python -m luffy.drift --stack dev
+    python -m luffy.drift --outputs outputs.json --endpoint-url http://127.0.0.1:5000
+
+With `--outputs`, stack outputs are read from a file (from `pulumi
+stack output --json`) and no Gandi key is needed: this is meant for
+the local stand-ins (LiveDNS with `LIVEDNS_API`, moto for Route53).
+"""
+
+import re
+import sys
+import json
+import hashlib
+import argparse
+import ipaddress
+
+from . import livedns, route53
+
+geolocations = {
+    "ContinentCode": "continent",
+    "CountryCode": "country",
+    "SubdivisionCode": "subdivision",
+}
+
+
+def fqdn(zone, name):
+    """Fully qualified name of a record."""
+    name = name.rstrip(".").lower()
+    if name in ("@", zone):
+        return f"{zone}."
+    if name.endswith(f".{zone}"):
+        return f"{name}."
+    return f"{name}.{zone}."
+
+
+def value(rrtype, value):
+    """Canonical representation of a value."""
+    if value.startswith("ALIAS "):
+        return value
+    if rrtype in ("A", "AAAA"):
+        return str(ipaddress.ip_address(value))
+    if rrtype == "TXT":
+        # Long values may be split in several strings
+        parts = re.findall(r'"((?:[^"\\]|\\.)*)"', value)
+        return f'"{"".join(parts) if parts else value}"'
+    return value
+
+
+def routing(
+    set_identifier=None,
+    geolocation=None,
+    region=None,
+    health_check=None,
+    weight=None,
+    multivalue=None,
+):
+    """Canonical representation of a routing policy."""
+    items = []
+    if set_identifier:
+        items.append(f"id={set_identifier}")
+    if geolocation:
+        items.append(
+            "geo=" + ",".join(f"{k}:{v}" for k, v in sorted(geolocation.items()))
+        )
+    if region:
+        items.append(f"latency={region}")
+    if health_check:
+        items.append(f"health={health_check}")
+    if weight is not None:
+        items.append(f"weight={weight}")
+    if multivalue:
+        items.append("multivalue")
+    return " ".join(items)
+
+
+def line(name, ttl, rrtype, data, policy=""):
+    """Canonical line for one value of a RRset, zone file style.
+
+    Aliases have no TTL.
+    """
+    data = value(rrtype, data)
+    if data.startswith("ALIAS "):
+        ttl = None
+    return f"{name} {ttl or 0} {rrtype} {data}" + (policy and f" ; {policy}")
+
+
+def alias(name, zone_id):
+    """Value for an alias record."""
+    zone_id = zone_id.removeprefix("/hostedzone/")
+    return f"ALIAS {name.rstrip('.').lower()}. {zone_id}"
+
+
+def digest(lines):
+    """Hash of a set of canonical lines."""
+    return hashlib.sha256("\n".join(sorted(set(lines))).encode()).hexdigest()
+
+
+def gandi(zone, key):
+    """Live records of a Gandi zone."""
+    lines = []
+    for rrset in livedns.request(key, f"/domains/{zone}/records"):
+        for data in rrset["rrset_values"]:
+            lines.append(
+                line(
+                    fqdn(zone, rrset["rrset_name"]),
+                    rrset["rrset_ttl"],
+                    rrset["rrset_type"],
+                    data,
+                )
+            )
+    return lines
+
+
+def aws(client, zone, zone_id):
+    """Live records of a Route53 zone."""
+    lines = []
+    for rrset in route53.rrsets(client, zone_id):
+        # Names are escaped (\052 for *)
+        name = re.sub(r"\\(\d{3})", lambda mo: chr(int(mo.group(1), 8)), rrset["Name"])
+        policy = routing(
+            rrset.get("SetIdentifier"),
+            {
+                geolocations[k]: v
+                for k, v in rrset.get("GeoLocation", {}).items()
+                if k in geolocations
+            },
+            rrset.get("Region"),
+            rrset.get("HealthCheckId"),
+            rrset.get("Weight"),
+            rrset.get("MultiValueAnswer"),
+        )
+        target = rrset.get("AliasTarget")
+        if target:
+            values = [alias(target["DNSName"], target["HostedZoneId"])]
+        else:
+            values = [r["Value"] for r in rrset.get("ResourceRecords", [])]
+        for data in values:
+            lines.append(
+                line(fqdn(zone, name), rrset.get("TTL"), rrset["Type"], data, policy)
+            )
+    return lines
+
+
+def managed(zone, provider, desired, dynamic=False):
+    """Filter out records we do not manage.
+
+    Nameservers at the apex are created by the provider. In dynamic
+    zones, only declared names and types are managed (see `presence()`).
+    """
+    declared = {(line.split()[0], line.split()[2]) for line in desired}
+
+    def keep(line):
+        name, _, rrtype = line.split()[:3]
+        if (name, rrtype) in declared:
+            return True
+        if dynamic:
+            return False
+        if name != f"{zone}.":
+            return True
+        return rrtype not in (provider == "route53" and ("NS", "SOA") or ("NS",))
+
+    return keep
+
+
+def presence(line):
+    """Name and type of a line.
+
+    In dynamic zones, values (and TTL) of declared names may be
+    changed by updaters: only their presence is checked.
+    """
+    name, _, rrtype = line.split()[:3]
+    return f"{name} {rrtype}"
+
+
+def compare(desired, live):
+    """Lines missing from and added to the live zone."""
+    desired, live = set(desired), set(live)
+    return sorted(desired - live), sorted(live - desired)
+
+
+def check(zones, fetch):
+    """Compare declared zones with live ones. Return the drifted zones."""
+    drifted = {}
+    for source, zone in sorted(zones.items()):
+        provider, name = source.split(":", 1)
+        desired = zone["records"]
+        live = list(
+            filter(
+                managed(name, provider, desired, zone.get("dynamic")),
+                fetch(source, zone),
+            )
+        )
+        if zone.get("dynamic"):
+            desired = list(map(presence, desired))
+            live = list(map(presence, live))
+        if digest(desired) != digest(live):
+            drifted[source] = compare(desired, live)
+    return drifted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="detect drift of DNS zones")
+    parser.add_argument("--stack", default="dev", help="stack declaring zones")
+    parser.add_argument("--outputs", help="read stack outputs from a file")
+    parser.add_argument("--endpoint-url", help="Route53 endpoint")
+    options = parser.parse_args()
+
+    if options.outputs:
+        with open(options.outputs) as f:
+            zones = json.load(f)["zones"]
+        keys = {}
+    else:
+        from pulumi import automation as auto
+        from . import deploy
+
+        stack = auto.select_stack(stack_name=options.stack, work_dir=deploy.root)
+        project = stack.workspace.project_settings().name
+        zones = stack.outputs()["zones"].value
+        keys = {
+            account: stack.get_config(f"{project}:{account}").value
+            for account in {source.split(":")[0] for source in zones}
+            if account != "route53"
+        }
+
+    # Not needed by the program itself
+    import boto3
+
+    client = boto3.client("route53", endpoint_url=options.endpoint_url)
+
+    def fetch(source, zone):
+        provider, name = source.split(":", 1)
+        if provider == "route53":
+            return aws(client, name, zone["zone_id"])
+        return gandi(name, keys.get(provider, ""))
+
+    drifted = check(zones, fetch)
+    for source, (missing, added) in drifted.items():
+        print(f"{source}:")
+        for line in missing:
+            print(f"  - {line}")
+        for line in added:
+            print(f"  + {line}")
+    print(f"{len(drifted)}/{len(zones)} zones drifted", file=sys.stderr)
+    return drifted and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
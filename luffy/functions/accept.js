@@ -0,0 +1,27 @@
+// Viewer-request CloudFront Function (cloudfront-js-1.0).
+//
+// Browsers send many variations of the Accept header. As the cache is
+// keyed on it, reduce it to the few values the origin uses to select
+// an image format: AVIF, WebP or anything else.
+
+var buckets = [
+  ["image/avif", "image/avif,image/webp,*/*"],
+  ["image/webp", "image/webp,*/*"],
+];
+
+function normalize(accept) {
+  accept = (accept || "").toLowerCase();
+  for (var i = 0; i < buckets.length; i++) {
+    if (accept.indexOf(buckets[i][0]) !== -1) {
+      return buckets[i][1];
+    }
+  }
+  return "*/*";
+}
+
+function handler(event) {
+  var request = event.request;
+  var accept = request.headers.accept;
+  request.headers.accept = { value: normalize(accept && accept.value) };
+  return request;
+}
@@ -0,0 +1,51 @@
+// Replay recorded request headers through a CloudFront Function.
+//
+// Each line of the input is the expected Accept value, a tab and the
+// recorded Accept header. Mismatches are reported and the exit status
+// is non-zero when there is any:
+//
+//     node luffy/functions/replay.js luffy/functions/accept.js < luffy/functions/accept.txt
+
+var fs = require("fs");
+var vm = require("vm");
+
+var source = fs.readFileSync(process.argv[2], "utf8");
+var context = {};
+vm.runInNewContext(source, context);
+
+var lines = fs.readFileSync(0, "utf8").split("\n");
+var counts = {};
+var failures = 0;
+lines.forEach(function (line, index) {
+  if (!line || line[0] === "#") {
+    return;
+  }
+  var fields = line.split("\t");
+  var expected = fields[0];
+  var headers = {};
+  if (fields.length > 1) {
+    headers.accept = { value: fields.slice(1).join("\t") };
+  }
+  var request = context.handler({
+    version: "1.0",
+    context: { eventType: "viewer-request" },
+    viewer: { ip: "192.0.2.1" },
+    request: {
+      method: "GET",
+      uri: "/",
+      querystring: {},
+      headers: headers,
+      cookies: {},
+    },
+  });
+  var got = request.headers.accept.value;
+  counts[got] = (counts[got] || 0) + 1;
+  if (got !== expected) {
+    failures++;
+    console.log("line " + (index + 1) + ": expected " + expected + ", got " + got);
+  }
+});
+Object.keys(counts).forEach(function (value) {
+  console.log(counts[value] + "\t" + value);
+});
+process.exit(failures ? 1 : 0);
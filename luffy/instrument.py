@@ -0,0 +1,167 @@
+"""Instrumentation of the program construction.
+
+When `LUFFY_INSTRUMENT` is set to a path, each resource registration is
+attributed to a zone, a helper and a provider, and apply callbacks are
+timed. At exit, a JSON report is written to this path, as well as a
+profile of apply callbacks in folded format (`<path>.folded`), usable
+with flamegraph.pl or speedscope:
+
+    LUFFY_INSTRUMENT=/tmp/luffy.json pulumi preview
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import contextvars
+import collections
+
+import pulumi
+
+# Zone and helper for the code being run
+context = contextvars.ContextVar("context", default=(None, None))
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+resources = collections.Counter()
+applies = {}
+folded = collections.Counter()
+
+
+def helper(method):
+    """Attribute what is done by a zone method to the zone and the method.
+
+    For nested helpers, the outermost one wins.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if context.get()[1] is not None:
+            return method(self, *args, **kwargs)
+        token = context.set((self.name, method.__name__))
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            context.reset(token)
+
+    return wrapper
+
+
+class scope:
+    """Run code with the given zone and helper."""
+
+    def __init__(self, origin):
+        self.origin = origin
+
+    def __enter__(self):
+        self.token = context.set(self.origin)
+
+    def __exit__(self, *exc):
+        context.reset(self.token)
+
+
+def ours(path):
+    """Is the path part of this program?"""
+    return path.startswith(root) and "site-packages" not in path
+
+
+def stack():
+    """Names of the functions of this program in the current stack."""
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if ours(path) and path != __file__:
+            frames.append(frame.f_code.co_name)
+        frame = frame.f_back
+    return frames[::-1]
+
+
+def transformation(args):
+    """Record a resource registration."""
+    zone, name = context.get()
+    provider = args.type_.split(":")[0]
+    resources[(zone or "-", name or "-", provider, args.type_)] += 1
+    return None
+
+
+def timed(apply):
+    """Wrap `Output.apply()` to time callbacks from this program."""
+
+    @functools.wraps(apply)
+    def wrapper(self, func, *args, **kwargs):
+        code = getattr(func, "__code__", None)
+        if code is None or not ours(code.co_filename):
+            return apply(self, func, *args, **kwargs)
+        path = os.path.relpath(code.co_filename, root)
+        location = f"{code.co_name}@{path}:{code.co_firstlineno}"
+        frames = ";".join(stack() + [location])
+        zone, name = context.get()
+
+        def callback(*cargs, **ckwargs):
+            start = time.perf_counter()
+            try:
+                return func(*cargs, **ckwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats = applies.setdefault(
+                    location, {"calls": 0, "total": 0.0, "max": 0.0, "zones": set()}
+                )
+                stats["calls"] += 1
+                stats["total"] += elapsed
+                stats["max"] = max(stats["max"], elapsed)
+                if zone is not None:
+                    stats["zones"].add(f"{zone}/{name}")
+                folded[frames] += int(elapsed * 1_000_000)
+
+        return apply(self, callback, *args, **kwargs)
+
+    return wrapper
+
+
+def report(path):
+    """Write the JSON report and the folded profile."""
+    summary = {}
+    for key in ("zone", "helper", "provider", "type"):
+        summary[key] = collections.Counter()
+    for (zone, name, provider, rtype), count in resources.items():
+        summary["zone"][zone] += count
+        summary["helper"][name] += count
+        summary["provider"][provider] += count
+        summary["type"][rtype] += count
+    data = {
+        "resources": {
+            "total": sum(resources.values()),
+            **{
+                f"by-{key}": dict(counter.most_common())
+                for key, counter in summary.items()
+            },
+            "details": [
+                {"zone": z, "helper": h, "provider": p, "type": t, "count": c}
+                for (z, h, p, t), c in sorted(resources.items())
+            ],
+        },
+        "applies": [
+            {"callback": location, **stats, "zones": sorted(stats["zones"])}
+            for location, stats in sorted(
+                applies.items(), key=lambda x: x[1]["total"], reverse=True
+            )
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    with open(f"{path}.folded", "w") as f:
+        for frames, microseconds in sorted(folded.items()):
+            f.write(f"{frames} {microseconds}\n")
+
+
+def enable():
+    """Enable instrumentation if requested through the environment."""
+    path = os.environ.get("LUFFY_INSTRUMENT")
+    if not path:
+        return
+    pulumi.runtime.register_stack_transformation(transformation)
+    pulumi.Output.apply = timed(pulumi.Output.apply)
+    atexit.register(report, path)
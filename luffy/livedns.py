@@ -0,0 +1,146 @@
+"""Bulk management of Gandi LiveDNS zones.
+
+Instead of one resource per RRset, a whole zone is pushed with a
+single call to the LiveDNS API. The API endpoint can be overridden
+with `LIVEDNS_API` to target the local stand-in provided by this
+module (`python -m luffy.livedns --serve 8053`).
+"""
+
+import os
+import re
+import json
+import argparse
+import http.server
+import urllib.request
+
+import pulumi
+import pulumi.dynamic
+
+API = "https://api.gandi.net/v5/livedns"
+
+
+def request(key, path, method="GET", body=None, api=None):
+    """Query LiveDNS API."""
+    api = api or os.environ.get("LIVEDNS_API", API)
+    req = urllib.request.Request(
+        f"{api}{path}",
+        method=method,
+        data=body is not None and json.dumps(body).encode() or None,
+        headers={
+            "Authorization": f"Apikey {key}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        },
+    )
+    with urllib.request.urlopen(req) as response:
+        content = response.read()
+    return content and json.loads(content) or None
+
+
+def normalize(rrsets):
+    """Canonical representation of a list of RRsets."""
+    return sorted(
+        (
+            rrset["rrset_name"],
+            rrset["rrset_type"],
+            int(rrset["rrset_ttl"]),
+            tuple(sorted(rrset["rrset_values"])),
+        )
+        for rrset in rrsets
+    )
+
+
+class ZoneRecordsProvider(pulumi.dynamic.ResourceProvider):
+    """Push all records of a zone with a single PUT."""
+
+    def push(self, props, rrsets):
+        path = f"/domains/{props['zone']}/records"
+        current = request(props["key"], path)
+        declared = {(rrset["rrset_name"], rrset["rrset_type"]) for rrset in rrsets}
+        # Keep nameservers at the apex, unless we manage them
+        kept = [
+            {k: v for k, v in rrset.items() if k != "rrset_href"}
+            for rrset in current
+            if rrset["rrset_name"] == "@"
+            and rrset["rrset_type"] == "NS"
+            and ("@", "NS") not in declared
+        ]
+        request(props["key"], path, method="PUT", body={"items": kept + rrsets})
+
+    def create(self, props):
+        self.push(props, props["rrsets"])
+        return pulumi.dynamic.CreateResult(id_=props["zone"], outs=props)
+
+    def diff(self, id, olds, news):
+        return pulumi.dynamic.DiffResult(
+            changes=olds["zone"] != news["zone"]
+            or normalize(olds["rrsets"]) != normalize(news["rrsets"]),
+            replaces=["zone"] if olds["zone"] != news["zone"] else [],
+            delete_before_replace=False,
+        )
+
+    def update(self, id, olds, news):
+        self.push(news, news["rrsets"])
+        return pulumi.dynamic.UpdateResult(outs=news)
+
+    def delete(self, id, props):
+        path = f"/domains/{props['zone']}/records"
+        managed = {
+            (rrset["rrset_name"], rrset["rrset_type"]) for rrset in props["rrsets"]
+        }
+        current = request(props["key"], path)
+        remaining = [
+            {k: v for k, v in rrset.items() if k != "rrset_href"}
+            for rrset in current
+            if (rrset["rrset_name"], rrset["rrset_type"]) not in managed
+        ]
+        request(props["key"], path, method="PUT", body={"items": remaining})
+
+
+class ZoneRecords(pulumi.dynamic.Resource):
+    def __init__(self, name, zone, rrsets, key, opts=None):
+        """All records of a LiveDNS zone."""
+        super().__init__(
+            ZoneRecordsProvider(),
+            f"zone-{name}",
+            {"zone": zone, "rrsets": rrsets, "key": key},
+            pulumi.ResourceOptions.merge(
+                opts, pulumi.ResourceOptions(additional_secret_outputs=["key"])
+            ),
+        )
+
+
+class StandIn(http.server.BaseHTTPRequestHandler):
+    """Minimal in-memory stand-in for LiveDNS records API."""
+
+    zones = {}
+    path_re = re.compile(r"^/domains/(?P<zone>[^/]+)/records$")
+
+    def reply(self, code, body=None):
+        content = body is not None and json.dumps(body).encode() or b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        mo = self.path_re.match(self.path)
+        if not mo:
+            return self.reply(404, {"message": "not found"})
+        self.reply(200, self.zones.get(mo.group("zone"), []))
+
+    def do_PUT(self):
+        mo = self.path_re.match(self.path)
+        if not mo:
+            return self.reply(404, {"message": "not found"})
+        length = int(self.headers.get("Content-Length", 0))
+        self.zones[mo.group("zone")] = json.loads(self.rfile.read(length))["items"]
+        self.reply(201, {"message": "DNS Zone Record Created"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LiveDNS stand-in")
+    parser.add_argument("--serve", type=int, metavar="PORT", required=True)
+    options = parser.parse_args()
+    http.server.HTTPServer(("127.0.0.1", options.serve), StandIn).serve_forever()
@@ -0,0 +1,105 @@
+"""Export stack outputs to NixOps.
+
+The exported document is canonical and includes a hash of each
+server. It is only written when something changed and the list of
+changed servers is displayed, so that unchanged hosts can be skipped
+by the next deployment:
+
+    python -m luffy.nixops ~-automation/nixops-take1/pulumi.json
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+
+
+def digest(data):
+    """Hash of some JSON data."""
+    return hashlib.sha256(canonical(data).encode()).hexdigest()
+
+
+def canonical(data):
+    """Canonical JSON representation."""
+    return json.dumps(data, indent=2, sort_keys=True) + "\n"
+
+
+def document(outputs):
+    """Build the document to export from stack outputs."""
+    servers = sorted(outputs["all-servers"], key=lambda server: server["name"])
+    doc = {
+        "acme-zone": outputs["acme-zone"],
+        "all-servers": servers,
+        "hashes": {server["name"]: digest(server) for server in servers},
+    }
+    doc["hash"] = digest(doc)
+    return doc
+
+
+def diff(old, new):
+    """Per-server differences between two documents."""
+    old_servers = {server["name"]: server for server in old.get("all-servers", [])}
+    new_servers = {server["name"]: server for server in new["all-servers"]}
+    changes = {}
+    for name in sorted(set(old_servers) | set(new_servers)):
+        if name not in new_servers:
+            changes[name] = ["removed"]
+        elif name not in old_servers:
+            changes[name] = ["added"]
+        elif old_servers[name] != new_servers[name]:
+            before, after = old_servers[name], new_servers[name]
+            changes[name] = [
+                f"{key}: {before.get(key)} -> {after.get(key)}"
+                for key in sorted(set(before) | set(after))
+                if before.get(key) != after.get(key)
+            ]
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="export stack outputs to NixOps")
+    parser.add_argument("output", help="JSON file to write")
+    parser.add_argument(
+        "--stack", action="append", help="stack to export (can be repeated)"
+    )
+    parser.add_argument(
+        "--changed", action="store_true", help="only display changed servers"
+    )
+    options = parser.parse_args()
+
+    outputs = {}
+    for stack in options.stack or [None]:
+        command = ["pulumi", "stack", "output", "--json"]
+        if stack:
+            command += ["--stack", stack]
+        outputs.update(json.loads(subprocess.check_output(command)))
+    new = document(outputs)
+    try:
+        with open(options.output) as f:
+            old = json.load(f)
+    except FileNotFoundError:
+        old = {}
+    if old.get("hash") == new["hash"]:
+        if not options.changed:
+            print("unchanged", file=sys.stderr)
+        return 0
+
+    changes = diff(old, new)
+    for name, details in changes.items():
+        if options.changed:
+            if details != ["removed"]:
+                print(name)
+            continue
+        print(f"{name}:")
+        for detail in details:
+            print(f"  {detail}")
+    with open(f"{options.output}.tmp", "w") as f:
+        f.write(canonical(new))
+    os.replace(f"{options.output}.tmp", options.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
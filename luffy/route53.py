@@ -0,0 +1,35 @@
+"""Helpers for Route53 clients outside of Pulumi.
+
+They only use the actions allowed to users created by
+`Route53Zone.allow_user()`.
+"""
+
+
+def zone_id(client, zone):
+    """Hosted zone ID for a zone name."""
+    for page in client.get_paginator("list_hosted_zones").paginate():
+        for candidate in page["HostedZones"]:
+            if candidate["Name"] == f"{zone}.":
+                return candidate["Id"]
+    raise RuntimeError(f"zone {zone} not found")
+
+
+def rrsets(client, zone_id):
+    """All RRsets of a zone."""
+    for page in client.get_paginator("list_resource_record_sets").paginate(
+        HostedZoneId=zone_id
+    ):
+        yield from page["ResourceRecordSets"]
+
+
+def change(client, zone_id, changes, comment):
+    """Send a change batch and wait for it to be in sync."""
+    response = client.change_resource_record_sets(
+        HostedZoneId=zone_id,
+        ChangeBatch={"Comment": comment, "Changes": changes},
+    )
+    change = response["ChangeInfo"]["Id"]
+    client.get_waiter("resource_record_sets_changed").wait(
+        Id=change, WaiterConfig={"Delay": 5, "MaxAttempts": 60}
+    )
+    return change
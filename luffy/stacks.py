@@ -0,0 +1,25 @@
+"""References to other stacks.
+
+Modules can be deployed in separate stacks. When a module is not
+selected in the current stack but the `stacks` configuration maps it
+to another stack, its outputs are read from this stack instead of
+declaring its resources again.
+"""
+
+import pulumi
+
+references = {}
+
+
+def reference(module):
+    """Stack reference for a module, or `None` if declared here."""
+    config = pulumi.Config()
+    modules = config.get_object("modules")
+    if modules is None or module in modules:
+        return None
+    name = (config.get_object("stacks") or {}).get(module)
+    if name is None:
+        return None
+    if name not in references:
+        references[name] = pulumi.StackReference(name)
+    return references[name]
@@ -1,9 +1,13 @@
 from types import SimpleNamespace
+import os
 import ipaddress
+import yaml
 import pulumi
 import pulumi_hcloud as hcloud
 import pulumi_vultr as vultr
 
+from . import cache, stacks
+
 
 class Server:
     """Abstraction for a server."""
@@ -15,24 +19,39 @@ class HetznerServer(Server):
     def __init__(self, name, id):
         """An Hetzner server (we import them)"""
         # We do not create them. There is a problem with importing
-        # existing servers when they don't have an image.
+        # existing servers when they don't have an image. They are not
+        # read as resources either: only the lookup result is cached,
+        # so the program graph does not depend on the cache.
         self.name = name
-        self.obj = hcloud.Server.get(name, id=id)
-        self.ipv4_address = self.obj.ipv4_address
-        self.ipv6_address = self.obj.ipv6_address
+        addresses = cache.cached(
+            f"hcloud-server:{id}",
+            lambda: self.get(id),
+            config=["hcloud:token"],
+            environ=["HCLOUD_TOKEN"],
+        )
+        self.ipv4_address = addresses.apply(lambda x: x["ipv4_address"])
+        self.ipv6_address = addresses.apply(lambda x: x["ipv6_address"])
         hcloud.Rdns(
             f"rdns4-{name}",
-            server_id=self.obj.id.apply(int),
+            server_id=int(id),
             ip_address=self.ipv4_address,
             dns_ptr=name,
         )
         hcloud.Rdns(
             f"rdns6-{name}",
-            server_id=self.obj.id.apply(int),
+            server_id=int(id),
             ip_address=self.ipv6_address,
             dns_ptr=name,
         )
 
+    @staticmethod
+    def get(id):
+        """Fetch addresses of an existing server."""
+        obj = hcloud.get_server_output(id=int(id))
+        return pulumi.Output.all(
+            ipv4_address=obj.ipv4_address, ipv6_address=obj.ipv6_address
+        )
+
 
 class VultrServer(Server):
     hardware = "vultr"
@@ -59,39 +78,190 @@ class VultrServer(Server):
         )
 
 
-# Each location should be covered by at least two servers...
-all_servers = [
-    {
-        "server": HetznerServer("web03.luffy.cx", "1041986"),
-        "geolocations": [("continent", ["EU", "AF"])],
-        "tags": ["web", "isso"],
-    },
-    {
-        "server": HetznerServer("web04.luffy.cx", "1413514"),
-        "geolocations": [("continent", ["EU", "AF"])],
-        "tags": ["web"],
-    },
-    {
-        "server": HetznerServer("web05.luffy.cx", "15724596"),
-        "geolocations": [("continent", ["NA", "SA"])],
-        "tags": ["web"],
-    },
-    {
-        "server": VultrServer("web06.luffy.cx", plan="vc2-1c-1gb", region="ord"),
-        "geolocations": [("continent", ["NA", "SA"])],
-        "tags": ["web"],
-    },
-]
-pulumi.export(
-    "all-servers",
-    [
-        {
-            "tags": x["tags"],
-            **{
-                k: getattr(x["server"], k)
-                for k in ("name", "hardware", "ipv4_address", "ipv6_address")
-            },
+class RemoteServer(Server):
+    def __init__(self, name, hardware, servers):
+        """A server declared in another stack."""
+        self.name = name
+        self.hardware = hardware
+        server = servers.apply(lambda servers: self.find(name, servers))
+        self.ipv4_address = server.apply(lambda x: x["ipv4_address"])
+        self.ipv6_address = server.apply(lambda x: x["ipv6_address"])
+
+    @staticmethod
+    def find(name, servers):
+        for server in servers:
+            if server["name"] == name:
+                return server
+        raise RuntimeError(f"{name}: not found in stack outputs")
+
+
+class Pool:
+    """Servers with a given tag, covering each geolocation.
+
+    `replicas` is the minimum number of enabled servers for each
+    geolocation (`kind:code`, `*` for the default). Geolocations
+    declared by any server of the pool, even disabled, should be
+    covered.
+    """
+
+    def __init__(self, inventory, tag, replicas):
+        self.tag = tag
+        self.servers = inventory.tagged(tag)
+        declared = {
+            f"{kind}:{code}"
+            for server in inventory
+            if tag in server["tags"]
+            for kind, codes in server["geolocations"]
+            for code in codes
         }
-        for x in all_servers
-    ],
-)
+        missing = []
+        for geoloc in sorted(declared | set(replicas) - {"*"}):
+            wanted = replicas.get(geoloc, replicas.get("*", 1))
+            count = len(
+                [s for s in inventory.located(*geoloc.split(":")) if tag in s["tags"]]
+            )
+            if count < wanted:
+                missing.append(f"{geoloc} ({count}/{wanted})")
+        if missing:
+            raise RuntimeError(f"{tag}: not enough servers for {', '.join(missing)}")
+
+
+class Inventory:
+    """Inventory of servers, indexed by tag, provider and geolocation."""
+
+    providers = {"hetzner": HetznerServer, "vultr": VultrServer}
+    schema = {
+        "name": str,
+        "hetzner": dict,
+        "vultr": dict,
+        "geolocations": dict,
+        "region": str,
+        "tags": list,
+        "disabled": bool,
+        "capacity": int,
+    }
+
+    @classmethod
+    def load(cls, path, remote=None):
+        """Load inventory from a YAML file.
+
+        When `remote` is provided, this is the list of servers exported
+        by another stack and servers are not declared.
+        """
+        with open(path) as f:
+            entries = yaml.safe_load(f)
+        servers = []
+        for entry in entries:
+            cls.validate(entry)
+            (provider,) = set(entry) & set(cls.providers)
+            if remote is None:
+                server = cls.providers[provider](entry["name"], **entry[provider])
+            else:
+                server = RemoteServer(entry["name"], provider, remote)
+            servers.append(
+                {
+                    "server": server,
+                    "geolocations": list(entry["geolocations"].items()),
+                    "region": entry["region"],
+                    "tags": entry.get("tags", []),
+                    "disabled": entry.get("disabled", False),
+                    "capacity": entry.get("capacity", 1),
+                }
+            )
+        return cls(servers)
+
+    @classmethod
+    def validate(cls, entry):
+        name = entry.get("name", "?")
+        for key in ("name", "geolocations", "region"):
+            if key not in entry:
+                raise RuntimeError(f"{name}: missing {key}")
+        for key, value in entry.items():
+            if key not in cls.schema:
+                raise RuntimeError(f"{name}: unknown key {key}")
+            if not isinstance(value, cls.schema[key]):
+                raise RuntimeError(
+                    f"{name}: {key} should be a {cls.schema[key].__name__}"
+                )
+        if entry.get("capacity", 1) < 1:
+            raise RuntimeError(f"{name}: capacity should be positive")
+        if len(set(entry) & set(cls.providers)) != 1:
+            raise RuntimeError(f"{name}: exactly one provider expected")
+        for kind, codes in entry["geolocations"].items():
+            if kind not in ("continent", "country", "subdivision"):
+                raise RuntimeError(f"{name}: unknown geolocation {kind}")
+            if not isinstance(codes, list):
+                raise RuntimeError(f"{name}: geolocation {kind} should be a list")
+
+    def __init__(self, servers):
+        self.servers = servers
+        self.by_tag = {}
+        self.by_provider = {}
+        self.by_geolocation = {}
+        self.pools = {}
+        # Routing plans, see `dns.RoutingPlan`
+        self.plans = {}
+        for server in servers:
+            if server.get("disabled"):
+                continue
+            for tag in server["tags"]:
+                self.by_tag.setdefault(tag, []).append(server)
+            self.by_provider.setdefault(server["server"].hardware, []).append(server)
+            for kind, codes in server["geolocations"]:
+                for code in codes:
+                    self.by_geolocation.setdefault((kind, code), []).append(server)
+
+    def __iter__(self):
+        return iter(self.servers)
+
+    def tagged(self, tag):
+        """Enabled servers with the given tag."""
+        return self.by_tag.get(tag, [])
+
+    def hosted(self, provider):
+        """Enabled servers at the given provider."""
+        return self.by_provider.get(provider, [])
+
+    def located(self, kind, code):
+        """Enabled servers covering the given geolocation."""
+        return self.by_geolocation.get((kind, code), [])
+
+    def pool(self, tag):
+        """Pool of enabled servers with the given tag."""
+        if tag not in self.pools:
+            self.pools[tag] = Pool(self, tag, pools.get(tag, {}))
+        return self.pools[tag]
+
+
+# Minimum number of servers per geolocation for each pool
+pools = {"web": {"*": 2}}
+inventory = None
+
+
+def register():
+    """Declare servers."""
+    global inventory
+    if inventory is not None:
+        return inventory
+    path = os.path.join(os.path.dirname(__file__), "servers.yaml")
+    reference = stacks.reference("vm")
+    if reference is not None:
+        inventory = Inventory.load(path, reference.require_output("all-servers"))
+        return inventory
+    inventory = Inventory.load(path)
+    for tag in pools:
+        inventory.pool(tag)
+    pulumi.export(
+        "all-servers",
+        [
+            {
+                "tags": x["tags"],
+                **{
+                    k: getattr(x["server"], k)
+                    for k in ("name", "hardware", "ipv4_address", "ipv6_address")
+                },
+            }
+            for x in inventory
+        ],
+    )
+    return inventory
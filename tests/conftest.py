@@ -0,0 +1,53 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+
+@pytest.fixture
+def zone():
+    return "y.example.com"
+
+
+@pytest.fixture
+def route53(monkeypatch, zone):
+    """Route53 client to a mocked zone, counting change batches and waits."""
+    for key in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(key, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("route53")
+        created = client.create_hosted_zone(Name=zone, CallerReference="1")
+        client.zone_id = created["HostedZone"]["Id"]
+        client.batches = []
+        client.waits = []
+        client.meta.events.register(
+            "provide-client-params.route53.ChangeResourceRecordSets",
+            lambda params, **kwargs: client.batches.append(
+                params["ChangeBatch"]["Changes"]
+            ),
+        )
+        client.meta.events.register(
+            "provide-client-params.route53.GetChange",
+            lambda params, **kwargs: client.waits.append(params["Id"]),
+        )
+        yield client
+
+
+@pytest.fixture
+def records(route53):
+    """Records of the mocked zone, as (name, type, values)."""
+
+    def records():
+        return sorted(
+            (
+                rrset["Name"],
+                rrset["Type"],
+                [r["Value"] for r in rrset.get("ResourceRecords", [])],
+            )
+            for rrset in route53.list_resource_record_sets(
+                HostedZoneId=route53.zone_id
+            )["ResourceRecordSets"]
+            if rrset["Type"] in ("A", "AAAA", "TXT")
+        )
+
+    return records
@@ -0,0 +1,79 @@
+import sys
+
+import pytest
+
+from luffy import acme
+
+
+@pytest.fixture
+def zone():
+    return acme.zone
+
+
+def test_present(route53, records):
+    change = acme.present(
+        route53,
+        route53.zone_id,
+        [
+            ("example.com", "token1"),
+            ("*.example.com", "token2"),
+            ("_acme-challenge.www.example.com.", "token3"),
+        ],
+    )
+    assert change is not None
+    assert records() == [
+        ("example.com.acme.luffy.cx.", "TXT", ['"token1"', '"token2"']),
+        ("www.example.com.acme.luffy.cx.", "TXT", ['"token3"']),
+    ]
+    assert len(route53.batches) == 1
+    assert route53.waits == [change]
+
+
+def test_cleanup(route53, records):
+    acme.present(route53, route53.zone_id, [("example.com", "other")])
+    challenges = [
+        ("example.com", "token1"),
+        ("*.example.com", "token2"),
+        ("www.example.com", "token3"),
+    ]
+    acme.present(route53, route53.zone_id, challenges)
+    # Values from another run are kept
+    assert records()[0] == (
+        "example.com.acme.luffy.cx.",
+        "TXT",
+        ['"other"', '"token1"', '"token2"'],
+    )
+    route53.batches.clear()
+    route53.waits.clear()
+    change = acme.cleanup(route53, route53.zone_id, challenges)
+    assert records() == [("example.com.acme.luffy.cx.", "TXT", ['"other"'])]
+    assert len(route53.batches) == 1
+    assert route53.waits == [change]
+    assert acme.cleanup(route53, route53.zone_id, challenges) is None
+    assert len(route53.batches) == 1
+
+
+def test_certbot(route53, records, monkeypatch, tmp_path):
+    monkeypatch.setattr(acme.tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(acme.boto3, "client", lambda *args, **kwargs: route53)
+    monkeypatch.setenv("CERTBOT_ALL_DOMAINS", "example.com,www.example.com")
+    challenges = [("example.com", "token1", "1"), ("www.example.com", "token2", "0")]
+    for action in ("certbot-auth", "certbot-cleanup"):
+        monkeypatch.setattr(sys, "argv", ["acme", action])
+        for domain, token, remaining in challenges:
+            monkeypatch.setenv("CERTBOT_DOMAIN", domain)
+            monkeypatch.setenv("CERTBOT_VALIDATION", token)
+            monkeypatch.setenv("CERTBOT_REMAINING_CHALLENGES", remaining)
+            route53.batches.clear()
+            assert acme.main() == 0
+            if remaining != "0":
+                assert route53.batches == []
+        # Only flushed on the last challenge, in one batch
+        assert len(route53.batches) == 1
+        if action == "certbot-auth":
+            assert records() == [
+                ("example.com.acme.luffy.cx.", "TXT", ['"token1"']),
+                ("www.example.com.acme.luffy.cx.", "TXT", ['"token2"']),
+            ]
+    assert records() == []
+    assert list(tmp_path.iterdir()) == []
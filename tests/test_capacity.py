@@ -0,0 +1,79 @@
+import types
+
+from luffy import capacity
+
+options = types.SimpleNamespace(
+    max_rate=100, max_rtime=500, max_queue=10, replica_capacity=1
+)
+
+
+def entry(name, plan=None, capacity=1):
+    entry = {
+        "name": name,
+        "geolocations": {"continent": ["NA"]},
+        "region": "us-east-1",
+        "tags": ["web"],
+        "capacity": capacity,
+    }
+    if plan:
+        entry["vultr"] = {"plan": plan, "region": "ewr"}
+    else:
+        entry["hetzner"] = {"id": 1}
+    return entry
+
+
+def stats(rate, rtime, queue=0):
+    current = capacity.Stats()
+    for _ in range(10):
+        current.rates.append(rate)
+        current.queues.append(queue)
+        current.rtime.add(rtime / 1000)
+    return current
+
+
+def test_advise_idle():
+    entries = [entry("web05.luffy.cx", capacity=2), entry("web06.luffy.cx", capacity=2)]
+    proposals = capacity.advise(
+        entries,
+        {"web05.luffy.cx": stats(150, 50), "web06.luffy.cx": stats(150, 50)},
+        options,
+    )
+    assert proposals == {"continent:NA": []}
+
+
+def test_advise_upsize_before_replicas():
+    entries = [
+        entry("web05.luffy.cx", capacity=2),
+        entry("web06.luffy.cx", plan="vc2-1c-1gb"),
+    ]
+    # 400 req/s for a capacity of 3, 4 once web06 is upsized
+    proposals = capacity.advise(
+        entries,
+        {"web05.luffy.cx": stats(200, 100), "web06.luffy.cx": stats(200, 900)},
+        options,
+    )
+    assert proposals == {
+        "continent:NA": [
+            "upsize web06.luffy.cx: plan vc2-1c-1gb -> vc2-2c-4gb"
+            " (p95 rtime 926ms, p95 queue 0)"
+        ]
+    }
+
+
+def test_advise_replicas():
+    entries = [
+        entry("web05.luffy.cx", capacity=2),
+        entry("web06.luffy.cx", plan="vc2-1c-1gb"),
+    ]
+    proposals = capacity.advise(
+        entries,
+        {"web05.luffy.cx": stats(300, 100), "web06.luffy.cx": stats(300, 900)},
+        options,
+    )
+    changes = proposals["continent:NA"]
+    assert changes[0].startswith("upsize web06.luffy.cx")
+    assert changes[1] == (
+        "add 2 replica(s) for continent:NA (600 req/s, capacity 4, needed 6)"
+    )
+    assert "name: web07.luffy.cx" in changes[2]
+    assert "name: web08.luffy.cx" in changes[3]
@@ -0,0 +1,52 @@
+import gzip
+
+from luffy import cflogs
+
+fields = (
+    "date time x-edge-location cs-uri-stem x-edge-result-type"
+    " time-to-first-byte x-edge-detailed-result-type"
+)
+lines = [
+    "#Version: 1.0",
+    f"#Fields: {fields}",
+    "2024-01-01\t00:00:00\tCDG50-C1\t/a.jpg\tHit\t0.002\tHit",
+    "2024-01-01\t00:00:01\tCDG50-C1\t/b.jpg\tMiss\t0.150\tOriginShieldHit",
+    "2024-01-01\t00:00:02\tCDG50-C1\t/b.jpg\tMiss\t0.300\tMiss",
+    "2024-01-01\t00:00:03\tCDG50-C1\t/c.jpg\tError\t-\t-",
+    "",
+]
+
+
+def test_entries(tmp_path):
+    path = tmp_path / "E2ABCDEF.2024-01-01-00.abcd.gz"
+    with gzip.open(path, "wt") as f:
+        f.write("\n".join(lines))
+    entries = list(cflogs.entries(str(path)))
+    assert len(entries) == 4
+    assert entries[1]["cs-uri-stem"] == "/b.jpg"
+    assert entries[1]["x-edge-detailed-result-type"] == "OriginShieldHit"
+    assert entries[3]["time-to-first-byte"] is None
+    assert entries[3]["missing-field"] is None
+
+
+def test_stats(tmp_path):
+    path = tmp_path / "log"
+    path.write_text("\n".join(lines))
+    stats = cflogs.Stats(top=1)
+    for entry in cflogs.entries(str(path)):
+        stats.add(entry)
+    assert stats.hit_ratio() == 1 / 3
+    assert stats.results["OriginShieldHit"] == 1
+    assert stats.results["Error"] == 1
+    assert stats.missed.most_common(1) == [("/b.jpg", 2)]
+    assert stats.ttfb.total == 3
+    assert stats.ttfb_miss.total == 2
+    assert 300 <= stats.ttfb.percentile(100) < 300 * 1.05
+
+
+def test_topk():
+    top = cflogs.TopK(2)
+    for item in "aabbbc":
+        top.add(item)
+    # "c" replaced "a", inheriting its count
+    assert top.most_common(2) == [("b", 3), ("c", 3)]
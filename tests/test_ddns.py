@@ -0,0 +1,77 @@
+import botocore.exceptions
+
+from luffy import ddns
+
+
+def updater(client):
+    return ddns.Updater(client, "y.example.com", client.zone_id, debounce=30)
+
+
+def test_debounce(route53, records):
+    u = updater(route53)
+    u.submit("eizo", "A", "192.0.2.1", 0)
+    u.submit("eizo", "A", "192.0.2.2", 10)
+    u.submit("eizo", "AAAA", "2001:db8::1", 10)
+    u.submit("zoro", "A", "192.0.2.3", 35)
+    assert u.flush(30) is None
+    assert u.flush(40) is not None
+    # Only the last address of eizo, zoro is not stable yet
+    assert records() == [
+        ("eizo.y.example.com.", "A", ["192.0.2.2"]),
+        ("eizo.y.example.com.", "AAAA", ["2001:db8::1"]),
+    ]
+    assert len(route53.batches) == 1
+    assert u.flush(70) is not None
+    assert len(route53.batches) == 2
+    assert u.pending == {}
+
+
+def test_flap(route53, records):
+    u = updater(route53)
+    u.submit("eizo", "A", "192.0.2.1", 0)
+    u.flush(30)
+    u.submit("eizo", "A", "192.0.2.2", 40)
+    u.submit("eizo", "A", "192.0.2.1", 50)
+    assert u.flush(100) is None
+    assert len(route53.batches) == 1
+
+
+def test_backoff(route53, records, monkeypatch):
+    u = updater(route53)
+    send = route53.change_resource_record_sets
+
+    def throttled(**kwargs):
+        raise botocore.exceptions.ClientError(
+            {"Error": {"Code": "Throttling", "Message": "Rate exceeded"}},
+            "ChangeResourceRecordSets",
+        )
+
+    monkeypatch.setattr(route53, "change_resource_record_sets", throttled)
+    u.submit("eizo", "A", "192.0.2.1", 0)
+    assert u.flush(30) is None
+    assert (u.failures, u.retry) == (1, 40)
+    assert u.flush(35) is None
+    assert (u.failures, u.retry) == (1, 40)
+    assert u.flush(40) is None
+    assert (u.failures, u.retry) == (2, 60)
+    monkeypatch.setattr(route53, "change_resource_record_sets", send)
+    assert u.flush(50) is None
+    assert u.flush(60) is not None
+    assert u.failures == 0
+    assert records() == [("eizo.y.example.com.", "A", ["192.0.2.1"])]
+
+
+def test_rejected(route53, records):
+    u = updater(route53)
+    u.submit("eizo", "A", "192.0.2.1", 0)
+    u.submit("zoro", "AAAA", "2001:db8::1", 0)
+    # Not in the zone
+    u.pending["eizo.example.org.", "A"] = ("192.0.2.2", 0)
+    assert u.flush(30) is not None
+    assert u.pending == {}
+    assert records() == [
+        ("eizo.y.example.com.", "A", ["192.0.2.1"]),
+        ("zoro.y.example.com.", "AAAA", ["2001:db8::1"]),
+    ]
+    # The whole batch, then one change at a time
+    assert [len(batch) for batch in route53.batches] == [3, 1, 1, 1]
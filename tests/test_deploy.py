@@ -0,0 +1,116 @@
+import types
+
+import pytest
+
+from luffy import deploy
+
+prefix = "urn:pulumi:dns::pulumi-take1"
+
+
+def test_orphans():
+    desired = {
+        f"{prefix}::pulumi-python:dynamic:Resource::zone-bernat.ch": "0",
+        f"{prefix}::gandi:livedns/record:Record::A-@.enx.io": "0",
+    }
+    resources = [
+        {
+            "urn": f"{prefix}::gandi:livedns/record:Record::A-@.bernat.ch",
+            "type": "gandi:livedns/record:Record",
+            "inputs": {"zone": "bernat.ch"},
+        },
+        {
+            "urn": f"{prefix}::gandi:livedns/record:Record::A-@.enx.io",
+            "type": "gandi:livedns/record:Record",
+            "inputs": {"zone": "enx.io"},
+        },
+        {
+            "urn": f"{prefix}::pulumi-python:dynamic:Resource::zone-bernat.ch",
+            "type": "pulumi-python:dynamic:Resource",
+            "inputs": {"zone": "bernat.ch"},
+        },
+    ]
+    assert deploy.orphans(resources, desired) == [
+        f"{prefix}::gandi:livedns/record:Record::A-@.bernat.ch"
+    ]
+    assert deploy.orphans(resources[1:], desired) == []
+
+
+class Stack:
+    """Stack recording operations, with the signatures of pulumi 3.44."""
+
+    def __init__(self, resources=[]):
+        self.operations = []
+        self.resources = resources
+
+    def export_stack(self):
+        return types.SimpleNamespace(deployment={"resources": self.resources})
+
+    def refresh(self, parallel=None, message=None, target=None, on_output=None):
+        self.operations.append(("refresh", None))
+
+    def preview(
+        self, parallel=None, target=None, target_dependents=None, on_output=None
+    ):
+        self.operations.append(("preview", target))
+
+    def up(self, parallel=None, target=None, target_dependents=None, on_output=None):
+        self.operations.append(("up", target))
+
+
+@pytest.fixture
+def deployment(tmp_path, monkeypatch):
+    deployment = deploy.Deployment.__new__(deploy.Deployment)
+    deployment.name = "dns"
+    deployment.refresh_after = 3600
+    deployment.path = str(tmp_path / "state.json")
+    deployment.stack = Stack()
+    deployment.project = "pulumi-take1"
+    deployment.resources = {f"{prefix}::aws:route53/zone:Zone::bernat.ch": "1"}
+    monkeypatch.setattr(deployment, "desired", lambda: dict(deployment.resources))
+    return deployment
+
+
+def test_run_first_preview(deployment):
+    deployment.run(preview=True)
+    assert deployment.stack.operations == [("refresh", None), ("preview", None)]
+    assert "resources" not in deployment.load()
+
+
+def test_run_targets(deployment):
+    deployment.run()
+    assert deployment.stack.operations == [("refresh", None), ("up", None)]
+    deployment.stack.operations = []
+    deployment.run()
+    assert deployment.stack.operations == []
+    zone = f"{prefix}::aws:route53/zone:Zone::bernat.im"
+    deployment.resources[zone] = "2"
+    deployment.resources[f"{prefix}::aws:route53/zone:Zone::bernat.ch"] = "3"
+    deployment.run(preview=True)
+    deployment.run()
+    targets = [f"{prefix}::aws:route53/zone:Zone::bernat.ch", zone]
+    assert deployment.stack.operations == [("preview", targets), ("up", targets)]
+    assert deployment.load()["resources"] == deployment.resources
+
+
+def test_run_stale(deployment):
+    deployment.run()
+    state = deployment.load()
+    state["refreshed"] -= 7200
+    deployment.save(state)
+    deployment.stack.operations = []
+    deployment.run(preview=True)
+    assert deployment.stack.operations == [("refresh", None), ("preview", None)]
+
+
+def test_run_orphans(deployment):
+    deployment.resources[f"{prefix}::pulumi-python:dynamic:Resource::zone-enx.io"] = "4"
+    deployment.stack.resources = [
+        {
+            "urn": f"{prefix}::gandi:livedns/record:Record::A-@.enx.io",
+            "type": "gandi:livedns/record:Record",
+            "inputs": {"zone": "enx.io"},
+        }
+    ]
+    with pytest.raises(RuntimeError, match="remove individual Gandi records"):
+        deployment.run()
+    assert deployment.stack.operations == []
@@ -0,0 +1,145 @@
+import types
+
+import pytest
+
+from luffy import dns
+
+
+@pytest.fixture
+def zones():
+    primary = types.SimpleNamespace(rrsets=dns.RRsets("example.com"))
+    secondary = dns.GandiZone("example.com", types.SimpleNamespace(_name="gandi"), "")
+    yield primary, secondary
+    dns.pending.remove(secondary)
+    dns.zones.remove(secondary)
+
+
+def derived(zone):
+    return {(r.label, r.type): (r.ttl, r.values) for r in zone.rrsets}
+
+
+def test_derive_geolocation(zones):
+    primary, secondary = zones
+    for identifier, continent, address in (
+        ("eu", {"continent": "EU"}, "192.0.2.1"),
+        ("default", dict([dns.RoutingPlan.default]), "192.0.2.2"),
+    ):
+        primary.rrsets.add(
+            "www",
+            "A",
+            [address],
+            300,
+            geolocation_routing_policies=[continent],
+            set_identifier=identifier,
+        )
+    primary.rrsets.add(
+        "@",
+        "AAAA",
+        ["2001:db8::1"],
+        300,
+        geolocation_routing_policies=[{"continent": "EU"}],
+        set_identifier="eu",
+    )
+    primary.rrsets.add(
+        "@",
+        "AAAA",
+        ["2001:db8::2"],
+        300,
+        geolocation_routing_policies=[{"continent": "NA"}],
+        set_identifier="na",
+    )
+    secondary.derive(primary)
+    assert derived(secondary) == {
+        ("www", "A"): (300, ["192.0.2.2"]),
+        ("@", "AAAA"): (300, ["2001:db8::1", "2001:db8::2"]),
+    }
+
+
+def test_derive_aliases(zones):
+    primary, secondary = zones
+    alias = types.SimpleNamespace(name="d111111abcdef8.cloudfront.net")
+    for rrtype in ("A", "AAAA"):
+        primary.rrsets.add("media", rrtype, [], None, aliases=[alias])
+    primary.rrsets.add("media", "CAA", ['0 issue "amazon.com"'], 3600)
+    primary.rrsets.add("@", "CAA", ['0 issue "letsencrypt.org"'], 3600)
+    primary.rrsets.add("@", "DNSKEY", ["257 3 13 mock"], 3600)
+    secondary.derive(primary)
+    rrsets = derived(secondary)
+    assert set(rrsets) == {("media", "CNAME"), ("@", "CAA")}
+    assert rrsets[("@", "CAA")] == (
+        3600,
+        ['0 issue "amazon.com"', '0 issue "letsencrypt.org"'],
+    )
+
+
+def test_rrsets_merge():
+    rrsets = dns.RRsets("example.com")
+    rrsets.add("www", "A", ["192.0.2.1"], 300)
+    rrsets.add("www", "A", ["192.0.2.2", "192.0.2.1"], 300)
+    rrsets.add("www", "AAAA", ["2001:db8::1"], 300)
+    assert [(r.type, r.values) for r in rrsets] == [
+        ("A", ["192.0.2.1", "192.0.2.2"]),
+        ("AAAA", ["2001:db8::1"]),
+    ]
+
+
+def test_rrsets_conflicts():
+    rrsets = dns.RRsets("example.com")
+    rrsets.add("www", "A", ["192.0.2.1"], 300)
+    with pytest.raises(RuntimeError, match="www.example.com: conflicting A"):
+        rrsets.add("www", "A", ["192.0.2.2"], 600)
+    with pytest.raises(RuntimeError, match="www.example.com: conflicting A"):
+        rrsets.add("www", "A", ["192.0.2.2"], 300, set_identifier=None, weight=1)
+    with pytest.raises(RuntimeError, match="CNAME cannot coexist"):
+        rrsets.add("www", "CNAME", ["web.example.com."], 300)
+    rrsets.add("media", "CNAME", ["cdn.example.com."], 300)
+    with pytest.raises(RuntimeError, match="CNAME cannot coexist"):
+        rrsets.add("media", "TXT", ["hello"], 300)
+    with pytest.raises(RuntimeError, match="more than one CNAME"):
+        rrsets.add("media", "CNAME", ["other.example.com."], 300)
+    with pytest.raises(RuntimeError, match="^example.com: conflicting MX"):
+        rrsets.add("@", "MX", ["10 mx.example.com."], 300)
+        rrsets.add("@", "MX", ["20 mx.example.com."], 3600)
+
+
+def test_rrsets_set_identifier():
+    rrsets = dns.RRsets("example.com")
+    rrsets.add("www", "A", ["192.0.2.1"], 60, set_identifier="eu", weight=1)
+    rrsets.add("www", "A", ["192.0.2.2"], 60, set_identifier="na", weight=2)
+    assert len(rrsets) == 2
+
+
+def inventory(address):
+    from luffy import vm
+
+    return vm.Inventory(
+        [
+            {
+                "server": types.SimpleNamespace(
+                    name=f"web0{i}.luffy.cx",
+                    hardware="vultr",
+                    ipv4_address=f"{address}{i}",
+                    ipv6_address=f"2001:db8::{i}",
+                ),
+                "geolocations": [("continent", ["EU"])],
+                "region": "eu-central-1",
+                "tags": ["web"],
+                "capacity": 1,
+            }
+            for i in range(2)
+        ]
+    )
+
+
+def test_routing_plan():
+    first = inventory("192.0.2.")
+    plan = dns.RoutingPlan.get(first, "web")
+    assert dns.RoutingPlan.get(first, "web") is plan
+    assert plan.records[dns.RoutingPlan.default]["A"] == ["192.0.2.0", "192.0.2.1"]
+    # Another inventory, as in another build of the program
+    del first
+    second = inventory("198.51.100.")
+    other = dns.RoutingPlan.get(second, "web")
+    assert other is not plan
+    assert other.records["continent", "EU"]["A"] == ["198.51.100.0", "198.51.100.1"]
+    assert other.health_checks == {}
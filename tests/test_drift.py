@@ -0,0 +1,86 @@
+from luffy import drift
+
+
+def zones(records, dynamic=False):
+    return {
+        "route53:example.com": {
+            "zone_id": "Z1",
+            "records": records,
+            "dynamic": dynamic,
+        }
+    }
+
+
+def fetcher(lines):
+    return lambda source, zone: lines
+
+
+def test_line():
+    assert drift.line("www.example.com.", 300, "AAAA", "2001:DB8::0:1") == (
+        "www.example.com. 300 AAAA 2001:db8::1"
+    )
+    assert drift.line("example.com.", 300, "TXT", '"v=spf1" " -all"') == (
+        'example.com. 300 TXT "v=spf1 -all"'
+    )
+    assert drift.line("www.example.com.", None, "A", "192.0.2.1", "id=a") == (
+        "www.example.com. 0 A 192.0.2.1 ; id=a"
+    )
+
+
+def test_line_alias_without_ttl():
+    data = drift.alias("d111111abcdef8.cloudfront.net", "/hostedzone/Z2FDTNDATAQYW2")
+    assert drift.line("media.example.com.", 300, "A", data) == (
+        "media.example.com. 0 A ALIAS d111111abcdef8.cloudfront.net. Z2FDTNDATAQYW2"
+    )
+    assert drift.line("media.example.com.", 300, "A", data) == drift.line(
+        "media.example.com.", None, "A", data
+    )
+
+
+def test_check_in_sync():
+    desired = [
+        "www.example.com. 300 A 192.0.2.1",
+        "media.example.com. 0 A ALIAS d111111abcdef8.cloudfront.net. Z2",
+    ]
+    live = desired + [
+        "example.com. 172800 NS ns-1.awsdns-00.com.",
+        "example.com. 900 SOA ns-1.awsdns-00.com. hostmaster 1 7200 900 1209600 86400",
+    ]
+    assert drift.check(zones(desired), fetcher(live)) == {}
+
+
+def test_check_drift():
+    desired = [
+        "www.example.com. 300 A 192.0.2.1",
+        "www.example.com. 300 A 192.0.2.2",
+    ]
+    live = [
+        "www.example.com. 300 A 192.0.2.1",
+        "www.example.com. 300 A 192.0.2.3",
+        "test.example.com. 300 A 192.0.2.4",
+    ]
+    assert drift.check(zones(desired), fetcher(live)) == {
+        "route53:example.com": (
+            ["www.example.com. 300 A 192.0.2.2"],
+            ["test.example.com. 300 A 192.0.2.4", "www.example.com. 300 A 192.0.2.3"],
+        )
+    }
+
+
+def test_check_dynamic():
+    desired = [
+        "example.com. 300 A 192.0.2.1",
+        "example.com. 300 MX 10 mx.example.com.",
+    ]
+    live = [
+        # Updated by DDNS
+        "example.com. 60 A 192.0.2.10",
+        "example.com. 300 MX 10 mx.example.com.",
+        # Not declared
+        "eizo.example.com. 60 AAAA 2001:db8::1",
+        '_acme-challenge.example.com. 60 TXT "token"',
+    ]
+    assert drift.check(zones(desired, dynamic=True), fetcher(live)) == {}
+    assert drift.check(zones(desired, dynamic=True), fetcher(live[1:])) == {
+        "route53:example.com": (["example.com. A"], [])
+    }
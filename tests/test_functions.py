@@ -0,0 +1,32 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from luffy import deploy
+
+functions = os.path.join(deploy.root, "luffy", "functions")
+pytestmark = pytest.mark.skipif(not shutil.which("node"), reason="needs Node.js")
+
+
+def replay(lines):
+    return subprocess.run(
+        ["node", "replay.js", "accept.js"],
+        cwd=functions,
+        input=lines,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_accept():
+    with open(os.path.join(functions, "accept.txt")) as f:
+        result = replay(f.read())
+    assert result.returncode == 0, result.stdout
+
+
+def test_accept_mismatch():
+    result = replay("image/avif,image/webp,*/*\ttext/html\n")
+    assert result.returncode == 1
+    assert "line 1: expected image/avif,image/webp,*/*, got */*" in result.stdout
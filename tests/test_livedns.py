@@ -0,0 +1,77 @@
+import threading
+import http.server
+
+import pytest
+
+from luffy import livedns
+
+
+def rrset(name, rrtype, values, ttl=300):
+    return {
+        "rrset_name": name,
+        "rrset_type": rrtype,
+        "rrset_ttl": ttl,
+        "rrset_values": values,
+    }
+
+
+@pytest.fixture
+def api(monkeypatch):
+    livedns.StandIn.zones = {}
+    server = http.server.HTTPServer(("127.0.0.1", 0), livedns.StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("LIVEDNS_API", f"http://127.0.0.1:{server.server_port}")
+    yield livedns.StandIn.zones
+    server.shutdown()
+
+
+def test_normalize():
+    assert livedns.normalize(
+        [
+            rrset("www", "A", ["192.0.2.2", "192.0.2.1"], "300"),
+            rrset("@", "MX", ["10 mx.example.com."]),
+        ]
+    ) == [
+        ("@", "MX", 300, ("10 mx.example.com.",)),
+        ("www", "A", 300, ("192.0.2.1", "192.0.2.2")),
+    ]
+
+
+def test_diff():
+    provider = livedns.ZoneRecordsProvider()
+    olds = {"zone": "example.com", "rrsets": [rrset("www", "A", ["192.0.2.1"])]}
+    same = {
+        "zone": "example.com",
+        "rrsets": [rrset("www", "A", ["192.0.2.1"], "300")],
+    }
+    changed = {"zone": "example.com", "rrsets": [rrset("www", "A", ["192.0.2.2"])]}
+    moved = {**olds, "zone": "example.net"}
+    assert not provider.diff("example.com", olds, same).changes
+    assert provider.diff("example.com", olds, changed).changes
+    assert provider.diff("example.com", olds, changed).replaces == []
+    assert provider.diff("example.com", olds, moved).replaces == ["zone"]
+
+
+def test_push_and_delete(api):
+    provider = livedns.ZoneRecordsProvider()
+    api["example.com"] = [
+        rrset("@", "NS", ["ns1.gandi.net."], 10800),
+        rrset("old", "A", ["192.0.2.9"]),
+    ]
+    props = {
+        "zone": "example.com",
+        "key": "",
+        "rrsets": [rrset("www", "A", ["192.0.2.1"])],
+    }
+    provider.create(props)
+    assert api["example.com"] == [
+        rrset("@", "NS", ["ns1.gandi.net."], 10800),
+        rrset("www", "A", ["192.0.2.1"]),
+    ]
+    api["example.com"].append(rrset("other", "A", ["192.0.2.10"]))
+    provider.delete("example.com", props)
+    assert api["example.com"] == [
+        rrset("@", "NS", ["ns1.gandi.net."], 10800),
+        rrset("other", "A", ["192.0.2.10"]),
+    ]
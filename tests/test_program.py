@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import subprocess
+
+import yaml
+
+from luffy import deploy
+
+config = {"pulumi-take1:gandi-vb": "vb", "pulumi-take1:gandi-rb": "rb"}
+
+
+def build(stack="dev", project="pulumi-take1", config=config, references={}):
+    """Build the real program with mocks, as `Deployment.desired()` does."""
+    output = subprocess.run(
+        [sys.executable, "-m", "luffy.deploy", "--resources", stack],
+        input=json.dumps(dict(project=project, config=config, references=references)),
+        cwd=deploy.root,
+        env={**os.environ, "LUFFY_CACHE": "off"},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def test_build():
+    resources = build()
+    with open(os.path.join(deploy.root, "luffy", "servers.yaml")) as f:
+        servers = yaml.safe_load(f)
+    prefix = "urn:pulumi:dev::pulumi-take1"
+    for entry in servers:
+        if "vultr" in entry:
+            assert (
+                f"{prefix}::vultr:index/instance:Instance::{entry['name']}" in resources
+            )
+    assert f"{prefix}::aws:route53/zone:Zone::bernat.ch" in resources
+    assert f"{prefix}::pulumi-python:dynamic:Resource::zone-bernat.ch" in resources
+    # Hashes are stable across builds
+    assert build() == resources
+
+
+def split(module):
+    """Configuration of the stack deploying a single module."""
+    stacks = {"vm": "vm", "kms": "kms", "cloudfront": "cdn", "dns": "dns"}
+    return {
+        **config,
+        "pulumi-take1:modules": json.dumps([module]),
+        "pulumi-take1:stacks": json.dumps(stacks),
+    }
+
+
+def references():
+    """Outputs of the other stacks."""
+    with open(os.path.join(deploy.root, "luffy", "servers.yaml")) as f:
+        servers = yaml.safe_load(f)
+    domains = ("media.bernat.ch", "media.une-oasis-une-ecole.fr")
+    return {
+        "vm": {
+            "all-servers": [
+                {
+                    "name": entry["name"],
+                    "hardware": "hetzner" in entry and "hetzner" or "vultr",
+                    "tags": entry.get("tags", []),
+                    "ipv4_address": f"192.0.2.{i}",
+                    "ipv6_address": f"2001:db8::{i}",
+                }
+                for i, entry in enumerate(servers)
+            ]
+        },
+        "kms": {"dns-cmk": "arn:aws:kms:us-east-1:123456789012:key/1"},
+        "cdn": {
+            "distributions": {
+                domain: {
+                    "domain_name": f"d{i}.cloudfront.net",
+                    "hosted_zone_id": "Z2FDTNDATAQYW2",
+                    "validation": {
+                        "name": f"_{i}.{domain}.",
+                        "value": f"_{i}.acm-validations.aws.",
+                    },
+                }
+                for i, domain in enumerate(domains)
+            }
+        },
+        "dns": {"zones": {"route53:bernat.ch": {"zone_id": "Z1"}}},
+    }
+
+
+def test_build_stacks():
+    cdn = build("cdn", config=split("cloudfront"), references=references())
+    dns = build("dns", config=split("dns"), references=references())
+    # Certificates are validated in the cdn stack, before the dns stack
+    # is updated
+    for urn in (
+        "urn:pulumi:cdn::pulumi-take1::aws:route53/record:Record::acm-media.bernat.ch",
+        "urn:pulumi:cdn::pulumi-take1::gandi:livedns/record:Record"
+        "::acm-media.une-oasis-une-ecole.fr",
+    ):
+        assert urn in cdn
+    assert not [urn for urn in dns if "_acm." in urn]
+    assert "urn:pulumi:dns::pulumi-take1::aws:route53/zone:Zone::bernat.ch" in dns
+    assert not [urn for urn in dns if "cloudfront/distribution" in urn]
@@ -0,0 +1,69 @@
+import types
+
+import pytest
+
+from luffy import vm
+
+
+def server(name, geolocations, disabled=False, tags=["web"]):
+    return {
+        "server": types.SimpleNamespace(name=name, hardware="vultr"),
+        "geolocations": list(geolocations.items()),
+        "region": "eu-central-1",
+        "tags": tags,
+        "disabled": disabled,
+        "capacity": 1,
+    }
+
+
+def test_pool_covered():
+    inventory = vm.Inventory(
+        [
+            server("web01", {"continent": ["EU"], "country": ["FR"]}),
+            server("web02", {"continent": ["EU", "NA"], "country": ["FR"]}),
+            server("web03", {"continent": ["NA"]}),
+        ]
+    )
+    pool = vm.Pool(inventory, "web", {"*": 2, "country:FR": 1})
+    assert [s["server"].name for s in pool.servers] == ["web01", "web02", "web03"]
+
+
+def test_pool_disabled():
+    inventory = vm.Inventory(
+        [
+            server("web01", {"continent": ["EU"]}),
+            server("web02", {"continent": ["EU"]}, disabled=True),
+            server("web03", {"continent": ["EU"]}, tags=["mail"]),
+        ]
+    )
+    with pytest.raises(
+        RuntimeError, match=r"web: not enough servers for continent:EU \(1/2\)"
+    ):
+        vm.Pool(inventory, "web", {"*": 2})
+
+
+def test_pool_explicit_geolocation():
+    inventory = vm.Inventory(
+        [
+            server("web01", {"continent": ["EU"]}),
+            server("web02", {"continent": ["EU"]}),
+        ]
+    )
+    with pytest.raises(RuntimeError, match=r"continent:NA \(0/1\)"):
+        vm.Pool(inventory, "web", {"*": 2, "continent:NA": 1})
+
+
+def test_validate():
+    entry = {
+        "name": "web01.luffy.cx",
+        "vultr": {"plan": "vc2-1c-1gb", "region": "ord"},
+        "geolocations": {"continent": ["NA"]},
+        "region": "us-east-1",
+    }
+    vm.Inventory.validate(entry)
+    with pytest.raises(RuntimeError, match="exactly one provider"):
+        vm.Inventory.validate({**entry, "hetzner": {"id": 1}})
+    with pytest.raises(RuntimeError, match="capacity should be positive"):
+        vm.Inventory.validate({**entry, "capacity": 0})
+    with pytest.raises(RuntimeError, match="unknown geolocation"):
+        vm.Inventory.validate({**entry, "geolocations": {"city": ["Paris"]}})